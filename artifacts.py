@@ -0,0 +1,87 @@
+"""
+Artifacts
+Export, store and reload of fitted models with the metadata needed to score new data.
+"""
+
+import io
+import os
+import tempfile
+
+import joblib
+
+MODEL_STORE_DIR = os.environ.get(
+    'MODEL_STORE_DIR',
+    os.path.join(os.path.expanduser('~'), '.cache', 'model-builder', 'models'))
+# zlib level of downloaded artifacts; the model store keeps them uncompressed so loading skips decompression
+ARTIFACT_COMPRESS = int(os.environ.get('ARTIFACT_COMPRESS', 3))
+ARTIFACT_SUFFIX = '.joblib'
+
+
+def make_artifact(model, feature_dtypes, target_name, params=None, preprocessor=None):
+    """Bundle a fitted model with its raw input feature dtypes (Series), target name, parameters and preprocessor"""
+    return {'model': model, 'feature_dtypes': feature_dtypes, 'target_name': target_name, 'params': params or {}, 'preprocessor': preprocessor}
+
+
+def export_artifact(artifact, compress=ARTIFACT_COMPRESS):
+    """Return a compressed joblib dump (bytes) of artifact, for downloading"""
+    buffer = io.BytesIO()
+    joblib.dump(artifact, buffer, compress=compress)
+    return buffer.getvalue()
+
+
+def store_path(name, store_dir=MODEL_STORE_DIR):
+    return os.path.join(store_dir, name + ARTIFACT_SUFFIX)
+
+
+def list_stored_artifacts(store_dir=MODEL_STORE_DIR):
+    """Return the names of the artifacts in the model store, newest first"""
+    if not os.path.isdir(store_dir):
+        return []
+    paths = [os.path.join(store_dir, file_name) for file_name in os.listdir(store_dir) if file_name.endswith(ARTIFACT_SUFFIX)]
+    paths.sort(key=os.path.getmtime, reverse=True)
+    return [os.path.basename(path)[:-len(ARTIFACT_SUFFIX)] for path in paths]
+
+
+def store_artifact(artifact, name, store_dir=MODEL_STORE_DIR):
+    """Write artifact uncompressed into the model store and return its path.
+
+    joblib writes every NumPy array (tree node and value arrays included) as a
+    raw, aligned block, which load_stored_artifact reads without decompression.
+    """
+    os.makedirs(store_dir, exist_ok=True)
+    path = store_path(name, store_dir)
+    # Write to a temporary file first so a reader never maps a half-written artifact
+    with tempfile.NamedTemporaryFile('wb', dir=store_dir, suffix='.tmp', delete=False) as tmp:
+        try:
+            joblib.dump(artifact, tmp)
+        except Exception:
+            tmp.close()
+            os.remove(tmp.name)
+            raise
+    os.replace(tmp.name, path)
+    return path
+
+
+def load_stored_artifact(name, store_dir=MODEL_STORE_DIR):
+    """Load an artifact from the model store, opening its arrays as read-only memory maps.
+
+    Nothing is decompressed. The model itself still ends up in memory:
+    scikit-learn copies each tree's node and value arrays into its own buffers
+    when the trees are rebuilt, so only the arrays outside the trees (if any)
+    stay mapped from disk.
+    """
+    return joblib.load(store_path(name, store_dir), mmap_mode='r')
+
+
+def read_uploaded_artifact(uploaded_file):
+    """Load an uploaded (compressed or not) artifact and return it, without adding it to the model store.
+
+    Artifacts are pickles: loading one runs whatever code it contains with the
+    server's permissions, so the app only calls this when its operator has
+    opted in (ALLOW_MODEL_UPLOAD) for users they trust.
+    """
+    uploaded_file.seek(0)
+    artifact = joblib.load(uploaded_file)
+    if not isinstance(artifact, dict) or 'model' not in artifact or 'feature_dtypes' not in artifact:
+        raise ValueError('The file is not a model artifact exported by this app.')
+    return artifact
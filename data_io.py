@@ -0,0 +1,99 @@
+"""
+Data I/O
+Loading and exporting of the data sets handled by the Streamlit app.
+"""
+
+import io
+import os
+import shutil
+import tempfile
+import urllib.request
+import zipfile
+
+import numpy as np
+import pandas as pd
+
+# Rows parsed per chunk when reading uploaded CSV files
+CSV_CHUNK_ROWS = 100_000
+
+EXAMPLE_DATA_URL = 'https://raw.githubusercontent.com/dataprofessor/data/master/delaney_solubility_with_descriptors.csv'
+# Bump the version whenever EXAMPLE_DATA_URL changes so stale local copies are not reused
+EXAMPLE_DATA_VERSION = 1
+EXAMPLE_DATA_CACHE_DIR = os.environ.get(
+    'EXAMPLE_DATA_CACHE_DIR',
+    os.path.join(os.path.expanduser('~'), '.cache', 'model-builder'))
+
+
+def example_data_path(cache_dir=EXAMPLE_DATA_CACHE_DIR):
+    """Return the local path of the cached example data set"""
+    return os.path.join(cache_dir, f'delaney_solubility_with_descriptors-v{EXAMPLE_DATA_VERSION}.csv')
+
+
+def load_example_data(cache_dir=EXAMPLE_DATA_CACHE_DIR, timeout=30):
+    """Return the example data set, downloading it into the local cache on first use.
+
+    Later calls read the cached file only, so the app keeps working offline.
+    Raises OSError when the file is not cached yet and cannot be downloaded.
+    """
+    path = example_data_path(cache_dir)
+    if not os.path.exists(path):
+        os.makedirs(cache_dir, exist_ok=True)
+        # Download to a temporary file first so an interrupted transfer never leaves a partial cache
+        with tempfile.NamedTemporaryFile('wb', dir=cache_dir, delete=False) as tmp:
+            try:
+                with urllib.request.urlopen(EXAMPLE_DATA_URL, timeout=timeout) as response:
+                    shutil.copyfileobj(response, tmp)
+            except OSError:
+                tmp.close()
+                os.remove(tmp.name)
+                raise
+        os.replace(tmp.name, path)
+    return pd.read_csv(path)
+
+
+def downcast_numeric(df):
+    """Downcast float64 columns to float32 and int64 columns to int32 where no value changes (in place)"""
+    for column in df.columns:
+        series = df[column]
+        if series.dtype == np.float64:
+            downcast = series.astype(np.float32)
+            if np.array_equal(downcast.to_numpy(np.float64), series.to_numpy(), equal_nan=True):
+                df[column] = downcast
+        elif series.dtype == np.int64 and len(series):
+            limits = np.iinfo(np.int32)
+            if limits.min <= series.min() and series.max() <= limits.max:
+                df[column] = series.astype(np.int32)
+    return df
+
+
+def read_uploaded_file(uploaded_file, chunksize=CSV_CHUNK_ROWS):
+    """Parse an uploaded CSV, Parquet or Feather file into a DataFrame with numerics downcast where lossless.
+
+    CSV files are parsed chunksize rows at a time and each chunk is downcast
+    before the next one is read, so a full float64 copy of a large file is never
+    held in memory. Chunks whose columns could not be downcast keep the wider
+    dtype once concatenated, so the result is always lossless.
+    """
+    uploaded_file.seek(0)
+    file_name = uploaded_file.name.lower()
+    if file_name.endswith('.parquet'):
+        return downcast_numeric(pd.read_parquet(uploaded_file))
+    if file_name.endswith('.feather'):
+        return downcast_numeric(pd.read_feather(uploaded_file))
+    chunks = [downcast_numeric(chunk) for chunk in pd.read_csv(uploaded_file, index_col=False, chunksize=chunksize)]
+    return pd.concat(chunks, ignore_index=True)
+
+
+def build_dataset_zip(frames):
+    """Return a ZIP archive (bytes) holding one CSV per entry of frames ({file name: DataFrame or Series}).
+
+    Each CSV is streamed straight into its archive member, so no intermediate
+    files are written and only the compressed archive is held in memory.
+    """
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for file_name, frame in frames.items():
+            with archive.open(file_name, 'w', force_zip64=True) as member:
+                with io.TextIOWrapper(member, encoding='utf-8', newline='') as text:
+                    frame.to_csv(text, index=False)
+    return buffer.getvalue()
@@ -0,0 +1,77 @@
+"""
+History
+Lightweight record of the models trained in a session, for comparing runs without retraining.
+"""
+
+import time
+
+import pandas as pd
+
+# Metrics kept per run, in display order
+RUN_METRICS = ['train_mse', 'train_r2', 'test_mse', 'test_r2', 'cv_test_mse', 'cv_test_r2', 'fit_time', 'predict_time']
+
+
+class RunHistory:
+    """Ordered runs of a session, one per model cache key, newest last.
+
+    A run keeps only parameters, metrics, timings and feature importances; the
+    fitted model itself stays in the model cache under run['model_key'].
+    Revisiting a configuration updates its run instead of adding another one.
+    """
+
+    def __init__(self, max_runs=50):
+        self.max_runs = max_runs
+        self.runs = []
+        self._next_id = 1
+
+    def add(self, model_key, estimator, params, metrics, importances=None, importance_kind=None):
+        """Record a run (metrics: {name in RUN_METRICS: value}, importances: Series by feature) and return it"""
+        previous = self.get(model_key)
+        if previous is not None:
+            self.runs.remove(previous)
+        run = {
+            'id': previous['id'] if previous is not None else self._next_id,
+            'model_key': model_key,
+            'estimator': estimator,
+            'params': dict(params),
+            'metrics': {name: metrics.get(name) for name in RUN_METRICS},
+            'importances': importances,
+            'importance_kind': importance_kind,
+            'recorded': time.time(),
+        }
+        if previous is None:
+            self._next_id += 1
+        self.runs.append(run)
+        del self.runs[:-self.max_runs]
+        return run
+
+    def get(self, model_key):
+        return next((run for run in self.runs if run['model_key'] == model_key), None)
+
+    @staticmethod
+    def label(run):
+        return f"#{run['id']} {run['estimator']}"
+
+    def to_frame(self):
+        """Return one row per run (newest first) with its parameters and metrics"""
+        rows = []
+        for run in reversed(self.runs):
+            row = {'run': self.label(run)}
+            row.update({name: ('all' if value is None and name == 'max_features' else value) for name, value in run['params'].items()})
+            row.update(run['metrics'])
+            rows.append(row)
+        return pd.DataFrame(rows).dropna(axis='columns', how='all')
+
+    def compare_metrics(self, runs):
+        """Return a metrics × runs table for side-by-side comparison"""
+        return pd.DataFrame({self.label(run): pd.Series(run['metrics'], index=RUN_METRICS) for run in runs}).dropna(how='all')
+
+    def compare_importances(self, runs):
+        """Return the feature importances of runs in long form (run, feature, importance, kind)"""
+        frames = [
+            pd.DataFrame({'run': self.label(run), 'feature': run['importances'].index, 'importance': run['importances'].to_numpy(),
+                          'kind': run['importance_kind']})
+            for run in runs if run['importances'] is not None]
+        if not frames:
+            return pd.DataFrame(columns=['run', 'feature', 'importance', 'kind'])
+        return pd.concat(frames, ignore_index=True)
@@ -0,0 +1,70 @@
+"""
+Instrumentation
+Per-stage wall time, CPU time and peak memory of a Streamlit run.
+"""
+
+import json
+import time
+import tracemalloc
+
+import pandas as pd
+
+
+class StageProfiler:
+    """Records wall time, CPU time and peak traced memory for consecutive named stages.
+
+    CPU time covers every thread of this process (e.g. n_jobs tree building) but
+    not worker processes. With track_memory, peak memory is measured with
+    tracemalloc, which sees Python and NumPy allocations; it is relative to the
+    memory in use when the stage started. Tracing and its peak are process-wide:
+    they are switched on for the rest of the process the first time a profiler
+    with track_memory=True is created, slow every allocation down, and the peak
+    of a stage includes whatever other sessions and background threads
+    allocated meanwhile. Memory tracking is therefore off by default.
+    """
+
+    def __init__(self, track_memory=False):
+        self.track_memory = track_memory
+        self.stages = []
+        self._current = None
+        if track_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def start(self, name):
+        """Start timing stage name, closing the previous stage if it is still open"""
+        if self._current is not None:
+            self.stop()
+        if self.track_memory:
+            tracemalloc.reset_peak()
+        self._current = {
+            'stage': name,
+            'wall_start': time.perf_counter(),
+            'cpu_start': time.process_time(),
+            'memory_start': tracemalloc.get_traced_memory()[0] if self.track_memory else 0,
+        }
+
+    def stop(self):
+        """Close the open stage and record its measurements"""
+        if self._current is None:
+            return
+        record = {
+            'stage': self._current['stage'],
+            'wall_time_s': time.perf_counter() - self._current['wall_start'],
+            'cpu_time_s': time.process_time() - self._current['cpu_start'],
+            'peak_memory_mb': None,
+        }
+        if self.track_memory:
+            peak = tracemalloc.get_traced_memory()[1]
+            record['peak_memory_mb'] = max(peak - self._current['memory_start'], 0) / 2**20
+        self.stages.append(record)
+        self._current = None
+
+    def add(self, name, wall_time_s, cpu_time_s=None, peak_memory_mb=None):
+        """Record a stage measured elsewhere, e.g. in a background job"""
+        self.stages.append({'stage': name, 'wall_time_s': wall_time_s, 'cpu_time_s': cpu_time_s, 'peak_memory_mb': peak_memory_mb})
+
+    def to_frame(self):
+        return pd.DataFrame(self.stages, columns=['stage', 'wall_time_s', 'cpu_time_s', 'peak_memory_mb'])
+
+    def to_json(self):
+        return json.dumps(self.stages, indent=2)
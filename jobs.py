@@ -0,0 +1,188 @@
+"""
+Jobs
+Background training jobs that outlive the Streamlit script run (and browser session) that started them.
+"""
+
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from training import finish_forest, grow_model, is_forest, model_size, score_predictions
+
+logger = logging.getLogger(__name__)
+
+
+class TrainingCancelled(Exception):
+    """Raised between tree batches once a job has been asked to stop"""
+
+
+class TrainingJob:
+    """A model being grown in a background thread; reruns poll its status and progress (trees built so far)"""
+
+    def __init__(self, model_key, n_estimators):
+        self.id = uuid.uuid4().hex
+        self.model_key = model_key
+        self.n_estimators = n_estimators
+        self.n_trees = 0
+        self.status = 'queued'
+        self.result = None
+        self.error = None
+        # Sessions waiting for the result, so one session cannot abandon a job others are attached to
+        self.sessions = set()
+        self._cancel = threading.Event()
+
+    def cancel(self):
+        """Ask the job to stop after the current batch and keep the trees built so far"""
+        self._cancel.set()
+
+    @property
+    def cancel_requested(self):
+        return self._cancel.is_set()
+
+    @property
+    def finished(self):
+        return self.status in ('done', 'cancelled', 'failed')
+
+
+def train_model(job, model, X_train, y_train, X_test, y_test, batch_size=None):
+    """Grow model to job.n_estimators trees (or boosting iterations) and return its model cache entry.
+
+    model is either a new estimator or a copy_model() copy to continue from.
+    Progress is published on job.n_trees after every batch. A cancelled job
+    keeps its partial model and is flagged with 'cancelled' in the entry.
+    """
+    oob_score = getattr(model, 'oob_score', False)
+
+    def on_batch(grown):
+        job.n_trees = model_size(grown)
+        if job.cancel_requested:
+            raise TrainingCancelled
+
+    timings = []
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    try:
+        grow_model(model, job.n_estimators, X_train, y_train, batch_size, on_batch)
+        cancelled = False
+    except TrainingCancelled:
+        if is_forest(model):
+            finish_forest(model, X_train, y_train, oob_score)
+        else:
+            model.set_params(warm_start=False)
+        cancelled = True
+    timings.append({'stage': 'fit', 'wall_time_s': time.perf_counter() - wall_start, 'cpu_time_s': time.process_time() - cpu_start})
+
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    y_train_pred = model.predict(X_train)
+    y_test_pred = model.predict(X_test)
+    timings.append({'stage': 'predict', 'wall_time_s': time.perf_counter() - wall_start, 'cpu_time_s': time.process_time() - cpu_start})
+
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    entry = {'model': model, 'y_train_pred': y_train_pred, 'y_test_pred': y_test_pred, 'cancelled': cancelled}
+    entry.update(score_predictions(y_train, y_train_pred, y_test, y_test_pred))
+    timings.append({'stage': 'metrics', 'wall_time_s': time.perf_counter() - wall_start, 'cpu_time_s': time.process_time() - cpu_start})
+
+    entry['fit_time'] = timings[0]['wall_time_s']
+    entry['timings'] = timings
+    return entry
+
+
+class JobManager:
+    """Process-wide registry of training jobs, looked up by model cache key.
+
+    Jobs run on a small thread pool (tree building releases the GIL, and each
+    model already trains on several threads). Finished jobs keep their result
+    until evicted, so any session asking for the same model key picks it up.
+    Only finished jobs are evicted: beyond max_jobs the least recently used
+    finished job goes, and queued or running jobs stay reachable. Sessions
+    register with watch() while they wait, and a job is only abandoned once
+    every session attached to it has moved on.
+    """
+
+    def __init__(self, max_workers=1, max_jobs=8):
+        self.max_jobs = max(int(max_jobs), 1)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='training-job')
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, model_key):
+        """Return the job (running or finished) for model_key, or None"""
+        with self._lock:
+            job = self._jobs.get(model_key)
+            if job is not None:
+                self._jobs.move_to_end(model_key)
+            return job
+
+    def submit(self, model_key, model, n_estimators, X_train, y_train, X_test, y_test, batch_size=None, session_id=None):
+        """Start growing model to n_estimators trees (or iterations) in the background, unless a job for model_key already exists.
+
+        session_id, if given, is registered as waiting for the job (see watch).
+        """
+        with self._lock:
+            job = self._jobs.get(model_key)
+            if job is not None and job.status != 'failed':
+                self._jobs.move_to_end(model_key)
+                if session_id is not None:
+                    job.sessions.add(session_id)
+                return job
+            job = TrainingJob(model_key, n_estimators)
+            if session_id is not None:
+                job.sessions.add(session_id)
+            self._jobs[model_key] = job
+            self._jobs.move_to_end(model_key)
+            self._evict()
+        self._executor.submit(self._run, job, model, X_train, y_train, X_test, y_test, batch_size)
+        return job
+
+    def discard(self, model_key):
+        """Forget the job for model_key (a running job is cancelled first)"""
+        with self._lock:
+            job = self._jobs.pop(model_key, None)
+        if job is not None and not job.finished:
+            job.cancel()
+
+    def watch(self, model_key, session_id):
+        """Register session_id as waiting for the job of model_key"""
+        with self._lock:
+            job = self._jobs.get(model_key)
+            if job is not None:
+                job.sessions.add(session_id)
+
+    def abandon(self, model_key, session_id):
+        """Stop waiting for the job of model_key; once no session waits for it, an unfinished job is cancelled and forgotten.
+
+        Finished jobs keep their result.
+        """
+        with self._lock:
+            job = self._jobs.get(model_key)
+            if job is None:
+                return
+            job.sessions.discard(session_id)
+            if job.finished or job.sessions:
+                return
+            del self._jobs[model_key]
+        job.cancel()
+
+    def _evict(self):
+        """Drop the least recently used finished jobs beyond max_jobs (called with the lock held)"""
+        finished = [key for key, job in self._jobs.items() if job.finished]
+        for key in finished[:max(len(self._jobs) - self.max_jobs, 0)]:
+            del self._jobs[key]
+
+    def _run(self, job, model, X_train, y_train, X_test, y_test, batch_size):
+        with self._lock:
+            abandoned = self._jobs.get(job.model_key) is not job
+        if abandoned:
+            # Discarded or abandoned while still queued: nobody can collect the result
+            job.status = 'cancelled'
+            return
+        job.status = 'running'
+        try:
+            job.result = train_model(job, model, X_train, y_train, X_test, y_test, batch_size)
+            job.status = 'cancelled' if job.result['cancelled'] else 'done'
+        except Exception as error:
+            logger.exception('Training job %s failed', job.id)
+            job.error = str(error)
+            job.status = 'failed'
@@ -0,0 +1,189 @@
+"""
+Model Cache
+Content fingerprints and LRU caches used to reuse data sets and fitted models across Streamlit reruns and sessions.
+"""
+
+import hashlib
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+import pandas as pd
+
+
+def dataframe_fingerprint(df):
+    """Return a content hash of a DataFrame (values, index, column names and dtypes)"""
+    digest = hashlib.sha256()
+    digest.update(pd.util.hash_pandas_object(df, index=True).values.tobytes())
+    digest.update(repr(list(df.columns)).encode('utf-8'))
+    digest.update(repr([str(dtype) for dtype in df.dtypes]).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def make_key(*parts):
+    """Build a stable cache key from hashable parts (fingerprints, parameter values, seeds)"""
+    return hashlib.sha256(repr(parts).encode('utf-8')).hexdigest()
+
+
+class LRUCache:
+    """Fixed-size mapping that evicts the least recently used entry once full"""
+
+    def __init__(self, max_entries=8):
+        self.max_entries = max(int(max_entries), 1)
+        self._entries = OrderedDict()
+
+    def get(self, key, default=None):
+        """Return the cached value for key and mark it as most recently used"""
+        if key not in self._entries:
+            return default
+        self._entries.move_to_end(key)
+        return self._entries[key]
+
+    def put(self, key, value):
+        """Store value under key, evicting the oldest entries beyond max_entries"""
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def pop(self, key, default=None):
+        """Remove key and return its value"""
+        return self._entries.pop(key, default)
+
+    def clear(self):
+        self._entries.clear()
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def estimate_size(value):
+    """Return the approximate memory footprint of value in bytes.
+
+    DataFrames and Series report their deep memory usage; containers are summed
+    item by item. Anything else (e.g. a fitted model) is pickled with its NumPy
+    buffers passed out of band, so large arrays are measured without being copied.
+    """
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(deep=True))
+    if isinstance(value, (tuple, list)):
+        return sum(estimate_size(item) for item in value)
+    if isinstance(value, dict):
+        return sum(estimate_size(item) for item in value.values())
+    buffers = []
+    in_band = pickle.dumps(value, protocol=5, buffer_callback=buffers.append)
+    return len(in_band) + sum(buffer.raw().nbytes for buffer in buffers)
+
+
+class SizedLRUCache:
+    """Thread-safe mapping bounded by the total estimated size of its values, evicting least recently used first.
+
+    Meant to be shared by every session of the server process, so identical
+    data sets and models (same content-hash key) are held once. Values larger
+    than the whole budget are not stored (see get_or_compute for keeping them
+    elsewhere). Hits, misses, evictions and rejected values are counted for
+    monitoring.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.resident_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.rejections = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """Return the cached value for key and mark it as most recently used"""
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self._entries.move_to_end(key)
+            entry = self._entries[key]
+            entry['hits'] += 1
+            return entry['value']
+
+    def put(self, key, value, kind='other'):
+        """Store value under key and evict old entries beyond the budget; returns False if value alone exceeds it"""
+        size = estimate_size(value)
+        with self._lock:
+            self._remove(key)
+            if size > self.max_bytes:
+                self.rejections += 1
+                return False
+            self._entries[key] = {'value': value, 'kind': kind, 'size': size, 'hits': 0, 'created': time.time()}
+            self.resident_bytes += size
+            while self.resident_bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+        return True
+
+    def get_or_compute(self, key, compute, kind='other', fallback=None):
+        """Return the cached value for key, computing and storing it with compute() on a miss.
+
+        A value too large for the budget goes to fallback instead when one is given
+        (an LRUCache, e.g. one per session), so it is not recomputed on every call.
+        """
+        value = self.get(key)
+        if value is None and fallback is not None:
+            value = fallback.get(key)
+        if value is None:
+            value = compute()
+            if not self.put(key, value, kind) and fallback is not None:
+                fallback.put(key, value)
+        return value
+
+    def pop(self, key, default=None):
+        """Remove key and return its value"""
+        with self._lock:
+            entry = self._remove(key)
+        return default if entry is None else entry['value']
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.resident_bytes = 0
+
+    def stats(self):
+        """Return hit/miss/eviction counters and the resident size against the budget"""
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'resident_bytes': self.resident_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'rejections': self.rejections,
+            }
+
+    def to_frame(self):
+        """Return one row per entry (least recently used first) with its kind, size and hit count"""
+        with self._lock:
+            rows = [
+                {'key': key[:12], 'kind': entry['kind'], 'size_mb': entry['size'] / 2**20, 'hits': entry['hits'],
+                 'age_s': time.time() - entry['created']}
+                for key, entry in self._entries.items()]
+        return pd.DataFrame(rows, columns=['key', 'kind', 'size_mb', 'hits', 'age_s'])
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.resident_bytes -= entry['size']
+        return entry
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,77 @@
+"""
+Plots
+Aggregated chart data and Altair charts for prediction sets too large to plot point by point.
+"""
+
+import altair as alt
+import numpy as np
+import pandas as pd
+
+
+def bin_predictions(actual, predicted, groups, bins=60):
+    """Return the non-empty cells of an actual-vs-predicted 2D histogram per group.
+
+    All groups share the same square bin edges, so the result never exceeds
+    bins * bins rows per group regardless of how many points are binned.
+    """
+    low = min(actual.min(), predicted.min())
+    high = max(actual.max(), predicted.max())
+    edges = np.linspace(low, high, bins + 1)
+    cells = []
+    for group in pd.unique(groups):
+        mask = groups == group
+        counts, _, _ = np.histogram2d(actual[mask], predicted[mask], bins=[edges, edges])
+        actual_bin, predicted_bin = np.nonzero(counts)
+        cells.append(pd.DataFrame({
+            'actual_start': edges[actual_bin],
+            'actual_end': edges[actual_bin + 1],
+            'predicted_start': edges[predicted_bin],
+            'predicted_end': edges[predicted_bin + 1],
+            'count': counts[actual_bin, predicted_bin].astype(int),
+            'class': group,
+        }))
+    return pd.concat(cells, ignore_index=True)
+
+
+def density_chart(binned):
+    """Return a heatmap of binned actual-vs-predicted counts, one panel per class"""
+    return alt.Chart(binned).mark_rect().encode(
+        x=alt.X('actual_start:Q', title='actual'),
+        x2='actual_end:Q',
+        y=alt.Y('predicted_start:Q', title='predicted'),
+        y2='predicted_end:Q',
+        color=alt.Color('count:Q', scale=alt.Scale(type='log')),
+        tooltip=['class:N', 'count:Q'],
+    ).facet(column='class:N')
+
+
+def learning_curve_chart(curve):
+    """Return test R2 and fit time against training-set size (log scale) as a line chart with two y axes"""
+    base = alt.Chart(curve).encode(
+        x=alt.X('n_samples:Q', scale=alt.Scale(type='log'), title='training samples'),
+        tooltip=['n_samples:Q', 'fraction:Q', 'test_r2:Q', 'fit_time:Q'],
+    )
+    test_r2 = base.mark_line(point=True).encode(y=alt.Y('test_r2:Q', title='test R2'))
+    fit_time = base.mark_line(point=True, strokeDash=[4, 4], color='orange').encode(
+        y=alt.Y('fit_time:Q', title='fit time (s)', axis=alt.Axis(titleColor='orange')))
+    return alt.layer(test_r2, fit_time).resolve_scale(y='independent')
+
+
+def permutation_importance_chart(importances):
+    """Return horizontal bars of mean permutation importance with one standard deviation error bars"""
+    base = alt.Chart(importances).encode(y=alt.Y('feature:N', sort='-x'))
+    bars = base.mark_bar(size=40).encode(x=alt.X('importance:Q', title='decrease in test R2'), tooltip=['feature:N', 'importance:Q', 'std:Q'])
+    errors = base.mark_errorbar().transform_calculate(
+        low='datum.importance - datum.std', high='datum.importance + datum.std',
+    ).encode(x='low:Q', x2='high:Q')
+    return alt.layer(bars, errors).properties(height=250)
+
+
+def importance_comparison_chart(importances):
+    """Return one panel of feature importance bars per run (long-form run/feature/importance), sharing the feature axis"""
+    return alt.Chart(importances).mark_bar().encode(
+        x=alt.X('importance:Q', title='importance'),
+        y=alt.Y('feature:N', title=None),
+        color=alt.Color('run:N', legend=None),
+        tooltip=['run:N', 'feature:N', 'importance:Q', 'kind:N'],
+    ).properties(width=160, height=250).facet(column=alt.Column('run:N', title=None))
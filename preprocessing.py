@@ -0,0 +1,82 @@
+"""
+Preprocessing
+Encoding of categorical columns and imputation of missing values before model fitting.
+"""
+
+import numpy as np
+import pandas as pd
+from sklearn.base import BaseEstimator, TransformerMixin
+
+
+class TablePreprocessor(TransformerMixin, BaseEstimator):
+    """Turns a raw feature table into an all-numeric matrix without missing values.
+
+    Non-numeric columns (strings, categories, dates) are replaced by integer
+    category codes, with -1 for missing and unseen values; numeric columns have
+    their missing values filled with the median seen during fit. Every step is
+    a column-wise vectorised pandas operation, so there is no per-row work.
+    As a scikit-learn transformer it can lead a Pipeline, so cross-validation
+    refits it on the training rows of each fold.
+    """
+
+    def fit(self, X, y=None):
+        self.input_dtypes_ = X.dtypes
+        self.categories_ = {}
+        self.fill_values_ = {}
+        for column in X.columns:
+            series = X[column]
+            if pd.api.types.is_numeric_dtype(series):
+                median = series.median()
+                self.fill_values_[column] = 0 if pd.isna(median) else median
+            else:
+                self.categories_[column] = pd.Categorical(series).categories
+        return self
+
+    def transform(self, X):
+        """Return the encoded, imputed copy of the fitted columns of X (extra columns are ignored)"""
+        columns = {}
+        for column in self.input_dtypes_.index:
+            if column in self.categories_:
+                codes = pd.Categorical(X[column], categories=self.categories_[column]).codes
+                columns[column] = codes.astype(np.int32, copy=False)
+            else:
+                columns[column] = X[column].fillna(self.fill_values_[column])
+        return pd.DataFrame(columns, index=X.index)
+
+    def summary(self):
+        """Return one row per input column with its dtype and the transformation applied"""
+        return pd.DataFrame({
+            'column': self.input_dtypes_.index,
+            'dtype': [str(dtype) for dtype in self.input_dtypes_],
+            'transformation': [
+                f'category codes ({len(self.categories_[column])} categories)' if column in self.categories_
+                else f'missing values filled with median {self.fill_values_[column]:.4g}'
+                for column in self.input_dtypes_.index],
+        })
+
+
+def labelled_features(df, target):
+    """Split df into the raw feature table and the target y, dropping rows without a target value.
+
+    Raises ValueError if the target column is not numeric, since all estimators
+    in this app are regressors.
+    """
+    y = df[target]
+    if not pd.api.types.is_numeric_dtype(y):
+        raise ValueError(f'The target column {target} is not numeric ({y.dtype}); pick a numeric column to predict.')
+    labelled = y.notna().to_numpy()
+    features = df.drop(columns=target)
+    if not labelled.all():
+        features = features[labelled]
+        y = y[labelled]
+    return features, y
+
+
+def prepare_split(X_train, X_test):
+    """Fit a TablePreprocessor on the training rows only and return the encoded X_train and X_test with it.
+
+    Medians and categories never see the test rows, so holdout scores are not
+    inflated by information from the rows they are measured on.
+    """
+    preprocessor = TablePreprocessor().fit(X_train)
+    return preprocessor.transform(X_train), preprocessor.transform(X_test), preprocessor
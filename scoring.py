@@ -0,0 +1,142 @@
+"""
+Scoring
+Batch prediction of new CSV files with a trained model, chunk by chunk.
+"""
+
+import gzip
+import os
+import tempfile
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from data_io import CSV_CHUNK_ROWS
+from training import copy_forest, is_forest
+
+# Directory of the gzipped prediction files offered for download, and how long (seconds) they are kept
+SCORING_OUTPUT_DIR = os.environ.get('SCORING_OUTPUT_DIR', os.path.join(tempfile.gettempdir(), 'model-builder-scoring'))
+SCORING_OUTPUT_MAX_AGE = float(os.environ.get('SCORING_OUTPUT_MAX_AGE', 3600))
+
+
+def check_columns(columns, feature_names, target_name=None):
+    """Return the problems (list of str) that prevent scoring a file with these columns.
+
+    The features must appear with the training names and in the training order.
+    The target column (target_name) may appear anywhere and is passed through unscored.
+    """
+    columns = [name for name in columns if name != target_name]
+    feature_names = list(feature_names)
+    missing = [name for name in feature_names if name not in columns]
+    unexpected = [name for name in columns if name not in feature_names]
+    problems = []
+    if missing:
+        problems.append(f'Missing feature columns: {", ".join(map(str, missing))}')
+    if unexpected:
+        problems.append(f'Unexpected columns: {", ".join(map(str, unexpected))}')
+    if not problems and columns != feature_names:
+        problems.append('Feature columns are not in the training order: ' + ', '.join(map(str, feature_names)))
+    return problems
+
+
+def check_dtypes(dtypes, feature_dtypes, imputes_missing=False):
+    """Return the problems (list of str) with the dtypes of a chunk, compared with the training dtypes.
+
+    Integer columns may be scored where the model was trained on floats, but
+    not the other way round unless imputes_missing (the artifact's
+    preprocessor fills missing values, which turn integer columns into
+    floats). Non-numeric data is never accepted for a numeric feature.
+    """
+    problems = []
+    for name, expected in feature_dtypes.items():
+        actual = dtypes[name]
+        if pd.api.types.is_numeric_dtype(expected) and not pd.api.types.is_numeric_dtype(actual):
+            problems.append(f'Column {name} holds non-numeric values ({actual}), expected {expected}')
+        elif not imputes_missing and pd.api.types.is_integer_dtype(expected) and pd.api.types.is_float_dtype(actual):
+            problems.append(f'Column {name} holds floats or missing values ({actual}), expected {expected}')
+    return problems
+
+
+def read_scoring_chunks(source, feature_dtypes, target_name=None, chunksize=CSV_CHUNK_ROWS, imputes_missing=False):
+    """Yield the chunks of a CSV file to score, raising ValueError on column or dtype problems.
+
+    The header is checked before the first chunk is parsed and every chunk is
+    checked before it is yielded, so bad rows deep in a file still stop scoring.
+    """
+    source.seek(0)
+    problems = check_columns(pd.read_csv(source, nrows=0).columns, feature_dtypes.index, target_name)
+    if problems:
+        raise ValueError('\n'.join(problems))
+    source.seek(0)
+    row_offset = 0
+    for chunk in pd.read_csv(source, index_col=False, chunksize=chunksize):
+        problems = check_dtypes(chunk.dtypes, feature_dtypes, imputes_missing)
+        if problems:
+            raise ValueError(f'Rows {row_offset + 1:,}–{row_offset + len(chunk):,}: ' + '; '.join(problems))
+        row_offset += len(chunk)
+        yield chunk
+
+
+def _predict_chunk(model, chunk, feature_names, preprocessor):
+    features = chunk[feature_names]
+    if preprocessor is not None:
+        features = preprocessor.transform(features)
+    chunk['prediction'] = model.predict(features)
+    return chunk
+
+
+def score_csv(model, source, feature_dtypes, output, target_name=None, chunksize=CSV_CHUNK_ROWS, n_jobs=None, on_chunk=None, preprocessor=None):
+    """Predict every row of the CSV file source and write it, plus a prediction column, to output as gzipped CSV.
+
+    Chunks are parsed lazily and predicted by n_jobs threads (all cores by
+    default), each with a single-threaded copy of the forest since tree
+    traversal releases the GIL; gradient boosting models predict one chunk at
+    a time on all cores. At most two chunks per thread are in flight and
+    chunks are written in input order, so neither the parsed input nor the
+    output is ever held in memory in full. on_chunk(n_rows) is called after each
+    chunk is written. Each chunk is encoded by preprocessor (see
+    preprocessing.TablePreprocessor), if given, before it is predicted.
+    Returns the number of rows scored.
+    """
+    n_jobs = n_jobs or os.cpu_count() or 1
+    if is_forest(model):
+        model = copy_forest(model, len(model.estimators_), n_jobs=1)
+    else:
+        # Gradient boosting already predicts each chunk on every core through OpenMP
+        n_jobs = 1
+    feature_names = list(feature_dtypes.index)
+    n_rows = 0
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=n_jobs) as executor, \
+            gzip.open(output, 'wt', encoding='utf-8', newline='') as text:
+
+        def write_next():
+            nonlocal n_rows
+            chunk = pending.popleft().result()
+            chunk.to_csv(text, index=False, header=n_rows == 0)
+            n_rows += len(chunk)
+            if on_chunk is not None:
+                on_chunk(n_rows)
+
+        for chunk in read_scoring_chunks(source, feature_dtypes, target_name, chunksize, imputes_missing=preprocessor is not None):
+            pending.append(executor.submit(_predict_chunk, model, chunk, feature_names, preprocessor))
+            if len(pending) >= 2 * n_jobs:
+                write_next()
+        while pending:
+            write_next()
+    return n_rows
+
+
+def scoring_output_file(output_dir=SCORING_OUTPUT_DIR, max_age=SCORING_OUTPUT_MAX_AGE):
+    """Return a new open file for gzipped predictions in output_dir, deleting files there older than max_age seconds"""
+    os.makedirs(output_dir, exist_ok=True)
+    expired = time.time() - max_age
+    for entry in os.scandir(output_dir):
+        try:
+            if entry.is_file() and entry.stat().st_mtime < expired:
+                os.remove(entry.path)
+        except FileNotFoundError:
+            # Removed meanwhile by another session
+            pass
+    return tempfile.NamedTemporaryFile(dir=output_dir, suffix='.csv.gz', delete=False)
@@ -2,11 +2,212 @@ import streamlit as st
 import pandas as pd
 import numpy as np
 from sklearn.model_selection import train_test_split
-from sklearn.ensemble import RandomForestRegressor
-from sklearn.metrics import mean_squared_error, r2_score
 import altair as alt
-import time
-import zipfile
+import os
+import hashlib
+import uuid
+from artifacts import ARTIFACT_SUFFIX, export_artifact, list_stored_artifacts, load_stored_artifact, make_artifact, read_uploaded_artifact, store_artifact, store_path
+from data_io import EXAMPLE_DATA_VERSION, build_dataset_zip, load_example_data, read_uploaded_file
+from history import RunHistory
+from instrumentation import StageProfiler
+from preprocessing import labelled_features, prepare_split
+from plots import bin_predictions, density_chart, importance_comparison_chart, learning_curve_chart, permutation_importance_chart
+from model_cache import LRUCache, SizedLRUCache, dataframe_fingerprint, make_key
+from jobs import JobManager
+from scoring import check_columns, score_csv, scoring_output_file
+from training import ESTIMATORS, SIZE_PARAMETERS, copy_model, cross_validate_model, make_estimator, model_size, permutation_importances, run_learning_curve, run_sweep, sweep_configurations
+
+# Number of recent model keys each session remembers for warm starts, and of finished background jobs kept
+# (the fitted models themselves live in the shared cache, bounded by SHARED_CACHE_MB)
+MODEL_CACHE_SIZE = int(os.environ.get('MODEL_CACHE_SIZE', 8))
+# Maximum number of rows sent to the browser per dataframe preview
+PREVIEW_ROWS = int(os.environ.get('PREVIEW_ROWS', 1000))
+# Above this many predictions the actual-vs-predicted scatter is replaced by a binned density view
+SCATTER_MAX_POINTS = int(os.environ.get('SCATTER_MAX_POINTS', 5000))
+# Set PROFILE_MEMORY=1 to add tracemalloc peak memory to the profile; tracing slows the whole process down
+# and its peaks cover every session and background job running at the same time
+PROFILE_MEMORY = os.environ.get('PROFILE_MEMORY', '0') != '0'
+# Number of models trained at the same time in the background (shared by all sessions), and how often (seconds)
+# the page polls them. One per CPU lets sessions train side by side; as each fit also uses n_jobs threads,
+# a lower value oversubscribes the CPUs less but queues each session's fit behind the others
+TRAINING_WORKERS = int(os.environ.get('TRAINING_WORKERS', os.cpu_count() or 1))
+JOB_POLL_INTERVAL = float(os.environ.get('JOB_POLL_INTERVAL', 1.0))
+# Number of runs kept in the session's run history
+RUN_HISTORY_SIZE = int(os.environ.get('RUN_HISTORY_SIZE', 50))
+# Memory budget (MB) of the cache of data sets, splits and models shared by all sessions
+SHARED_CACHE_MB = float(os.environ.get('SHARED_CACHE_MB', 1024))
+# Number of values too large for that budget which a session keeps for itself rather than recomputing every rerun
+OVERSIZE_CACHE_SIZE = int(os.environ.get('OVERSIZE_CACHE_SIZE', 8))
+# Set ALLOW_CACHE_CLEAR=1 to show the button that empties the shared cache, which affects every session
+ALLOW_CACHE_CLEAR = os.environ.get('ALLOW_CACHE_CLEAR', '0') != '0'
+# Set ALLOW_MODEL_UPLOAD=1 to let users load exported models: artifacts are pickles, so loading one
+# runs arbitrary code on the server. Only enable it when every user of the app is trusted.
+ALLOW_MODEL_UPLOAD = os.environ.get('ALLOW_MODEL_UPLOAD', '0') != '0'
+
+
+@st.cache_resource
+def get_shared_cache():
+    """Data sets, splits and models keyed by content hash, shared by every session of this server process"""
+    return SizedLRUCache(int(SHARED_CACHE_MB * 2**20))
+
+
+def get_session_cache():
+    """Values too large for the shared cache, kept for this session only"""
+    if 'oversize_cache' not in st.session_state:
+        st.session_state.oversize_cache = LRUCache(OVERSIZE_CACHE_SIZE)
+    return st.session_state.oversize_cache
+
+
+def get_uploaded_data(file_hash, uploaded_file):
+    """Parse an uploaded file once per content hash; returns the DataFrame and its memory footprint in bytes"""
+    def parse():
+        with st.spinner('Parsing uploaded file ...'):
+            uploaded_df = read_uploaded_file(uploaded_file)
+        return uploaded_df, uploaded_df.memory_usage(deep=True).sum()
+    return get_shared_cache().get_or_compute(make_key('upload', file_hash), parse, 'dataset', get_session_cache())
+
+
+def get_labelled_data(dataset_fingerprint, target, df):
+    """Separate the raw features and target of a data set once per content hash and target"""
+    return get_shared_cache().get_or_compute(
+        make_key('labelled', dataset_fingerprint, target), lambda: labelled_features(df, target), 'labelled data', get_session_cache())
+
+
+def get_prepared_split(split_key, features, y, test_size, random_state):
+    """Split a data set and preprocess it, fitted on the training rows only, once per split; hyperparameter-only reruns reuse the result"""
+    def prepare():
+        X_train, X_test, y_train, y_test = train_test_split(features, y, test_size=test_size, random_state=random_state)
+        with st.spinner('Encoding and imputing features ...'):
+            X_train, X_test, preprocessor = prepare_split(X_train, X_test)
+        return X_train, X_test, y_train, y_test, preprocessor
+    return get_shared_cache().get_or_compute(split_key, prepare, 'split', get_session_cache())
+
+
+def preview_rows(n_rows, key, in_zip=True):
+    """Render paging/sampling controls for a preview of n_rows rows and return the row positions to display"""
+    if n_rows <= PREVIEW_ROWS:
+        return slice(None)
+    zip_hint = ' Use *Download ZIP* for the full data.' if in_zip else ''
+    mode_col, page_col = st.columns(2)
+    mode = mode_col.radio('Preview', ['Page', 'Random sample'], horizontal=True, key=f'{key}_preview_mode')
+    if mode == 'Page':
+        n_pages = -(-n_rows // PREVIEW_ROWS)
+        page = page_col.number_input(f'Page (of {n_pages:,})', 1, n_pages, 1, key=f'{key}_preview_page')
+        start = (page - 1) * PREVIEW_ROWS
+        st.caption(f'Showing rows {start + 1:,}–{min(start + PREVIEW_ROWS, n_rows):,} of {n_rows:,}.{zip_hint}')
+        return slice(start, start + PREVIEW_ROWS)
+    st.caption(f'Showing a random sample of {PREVIEW_ROWS:,} of {n_rows:,} rows.{zip_hint}')
+    # Fixed seed so the sample does not change on every rerun
+    return np.sort(np.random.default_rng(0).choice(n_rows, PREVIEW_ROWS, replace=False))
+
+
+def model_cache_keys(split_key, estimator, model_params):
+    """Return (forest_key, model_key); models sharing a forest_key differ only by their size (n_estimators or max_iter)"""
+    size_parameter = SIZE_PARAMETERS[estimator]
+    forest_key = make_key(split_key, estimator, *sorted((name, value) for name, value in model_params.items() if name != size_parameter))
+    return forest_key, make_key(forest_key, model_params[size_parameter])
+
+
+def select_sweep_row():
+    """Copy the parameters of the picked leaderboard row into the sidebar widgets"""
+    rows = st.session_state.sweep_leaderboard.selection.rows
+    if rows:
+        row = st.session_state.sweep_results.iloc[rows[0]]
+        for name in ('n_estimators', 'max_features', 'min_samples_split', 'min_samples_leaf', 'criterion'):
+            st.session_state[name] = row[name].item() if hasattr(row[name], 'item') else row[name]
+
+
+@st.cache_resource
+def get_job_manager():
+    """Training jobs are shared by every session of this server process"""
+    return JobManager(max_workers=TRAINING_WORKERS, max_jobs=MODEL_CACHE_SIZE)
+
+
+@st.fragment(run_every=JOB_POLL_INTERVAL)
+def show_job_progress(job):
+    """Poll a background training job and rerun the whole app once it has finished"""
+    if job.finished:
+        st.rerun()
+    st.progress(job.n_trees / job.n_estimators, text=f'{job.n_trees} of {job.n_estimators} trees built (job {job.id[:8]}, {job.status})')
+
+
+def cancel_training(model_key):
+    job = get_job_manager().get(model_key)
+    if job is not None:
+        job.cancel()
+
+
+def discard_scoring_output():
+    """Delete the gzipped predictions of the previous batch scoring run"""
+    scoring = st.session_state.pop('scoring', None)
+    if scoring is not None and os.path.exists(scoring['path']):
+        os.remove(scoring['path'])
+
+
+def batch_scoring(artifact, model_key):
+    """Render the batch scoring section for a model artifact (see artifacts.make_artifact)"""
+    st.header('Batch scoring', divider='rainbow')
+    scoring_file = st.file_uploader('Upload a CSV file with the training feature columns to predict', type=['csv'], key='scoring_file')
+    if scoring_file is not None:
+        # The header is checked right away; dtypes are checked chunk by chunk while scoring
+        scoring_file.seek(0)
+        try:
+            column_problems = check_columns(pd.read_csv(scoring_file, nrows=0).columns, artifact['feature_dtypes'].index, artifact['target_name'])
+        except ValueError as error:
+            # Empty or malformed CSV (pandas' EmptyDataError and ParserError are ValueErrors)
+            column_problems = [f'The file could not be read as CSV: {error}']
+        scoring_key = make_key(model_key, scoring_file.file_id)
+        if st.session_state.get('scoring', {}).get('key') == scoring_key and not os.path.exists(st.session_state.scoring['path']):
+            st.session_state.pop('scoring')
+            st.info('The scored file has expired. Score it again to download the predictions.')
+        if column_problems:
+            st.error('\n\n'.join(column_problems))
+        elif st.session_state.get('scoring', {}).get('key') != scoring_key:
+            if st.button('Score file'):
+                profiler.start('scoring')
+                discard_scoring_output()
+                scoring_progress = st.progress(0.0, text='Scoring ...')
+                # Outputs older than SCORING_OUTPUT_MAX_AGE are deleted, whichever session wrote them
+                with scoring_output_file() as output:
+                    try:
+                        n_scored = score_csv(artifact['model'], scoring_file, artifact['feature_dtypes'], output, artifact['target_name'],
+                                             preprocessor=artifact.get('preprocessor'),
+                                             on_chunk=lambda n_rows: scoring_progress.progress(
+                                                 min(scoring_file.tell() / scoring_file.size, 1.0), text=f'{n_rows:,} rows scored'))
+                    except ValueError as error:
+                        n_scored = None
+                        st.error(str(error))
+                scoring_progress.empty()
+                if n_scored is None:
+                    os.remove(output.name)
+                else:
+                    st.session_state.scoring = {'key': scoring_key, 'path': output.name, 'n_rows': n_scored}
+                profiler.stop()
+        if st.session_state.get('scoring', {}).get('key') == scoring_key:
+            scoring = st.session_state.scoring
+            st.caption(f"{scoring['n_rows']:,} rows scored, {os.path.getsize(scoring['path']) / 2**20:,.1f} MB compressed.")
+            with open(scoring['path'], 'rb') as predictions_file:
+                st.download_button(
+                    label='Download predictions',
+                    data=predictions_file,
+                    file_name='predictions.csv.gz',
+                    mime='application/gzip',
+                )
+
+
+@st.cache_resource(max_entries=4)
+def get_stored_artifact(name, modified_time):
+    """Load a stored artifact once per process; a rewritten file gets a new modification time"""
+    return load_stored_artifact(name)
+
+
+def resume_training(model_key, forest_key):
+    """Drop a cancelled partial forest from the caches so the next run keeps growing it"""
+    get_job_manager().discard(model_key)
+    entry = get_shared_cache().pop(model_key)
+    if entry is not None:
+        st.session_state.partial_fit = {'model_key': model_key, 'forest_key': forest_key, 'forest': entry['model']}
+
 
 # Page title
 st.set_page_config(page_title='ML Model Building', page_icon='🤖')
@@ -32,158 +233,391 @@ with st.expander('About this app'):
   ''', language='markdown')
 
 
+# Wall time, CPU time and peak memory of each stage of this run
+profiler = StageProfiler(track_memory=PROFILE_MEMORY)
+
 # Sidebar for accepting input parameters
 with st.sidebar:
     # Load data
+    profiler.start('load')
     st.header('1.1. Input data')
 
     st.markdown('**1. Use custom data**')
-    uploaded_file = st.file_uploader("Upload a CSV file", type=["csv"])
+    uploaded_file = st.file_uploader("Upload a CSV, Parquet or Feather file", type=["csv", "parquet", "feather"])
     if uploaded_file is not None:
-        df = pd.read_csv(uploaded_file, index_col=False)
+        # Hash each upload once; reruns look the parsed frame up by content hash
+        upload_hashes = st.session_state.setdefault('upload_hashes', {})
+        if uploaded_file.file_id not in upload_hashes:
+            upload_hashes.clear()
+            upload_hashes[uploaded_file.file_id] = hashlib.sha256(uploaded_file.getvalue()).hexdigest()
+        df, df_memory = get_uploaded_data(upload_hashes[uploaded_file.file_id], uploaded_file)
+        dataset_source = make_key('upload', upload_hashes[uploaded_file.file_id])
+        st.caption(f'{df.shape[0]:,} rows × {df.shape[1]} columns, {df_memory / 2**20:,.1f} MB in memory')
       
     # Download example data
     @st.cache_data
     def convert_df(input_df):
         return input_df.to_csv(index=False).encode('utf-8')
-    example_csv = pd.read_csv('https://raw.githubusercontent.com/dataprofessor/data/master/delaney_solubility_with_descriptors.csv')
-    csv = convert_df(example_csv)
-    st.download_button(
-        label="Download example CSV",
-        data=csv,
-        file_name='delaney_solubility_with_descriptors.csv',
-        mime='text/csv',
-    )
+
+    # Parsed once per process from the local copy and shared by all sessions; only the very first run needs the network
+    try:
+        example_csv = get_shared_cache().get_or_compute(make_key('example', EXAMPLE_DATA_VERSION), load_example_data, 'dataset', get_session_cache())
+    except OSError:
+        example_csv = None
+        st.error('The example data set could not be downloaded. Check the network connection and reload the app.')
+
+    if example_csv is not None:
+        csv = convert_df(example_csv)
+        st.download_button(
+            label="Download example CSV",
+            data=csv,
+            file_name='delaney_solubility_with_descriptors.csv',
+            mime='text/csv',
+        )
 
     # Select example data
     st.markdown('**1.2. Use example data**')
-    example_data = st.toggle('Load example data')
+    example_data = st.toggle('Load example data', disabled=example_csv is None)
     if example_data:
-        df = pd.read_csv('https://raw.githubusercontent.com/dataprofessor/data/master/delaney_solubility_with_descriptors.csv')
+        df = example_csv
+        dataset_source = make_key('example', EXAMPLE_DATA_VERSION)
+    if uploaded_file or example_data:
+        # Every column other than the target is a feature; the last column is the default target
+        parameter_target = st.selectbox('Target column (y)', list(df.columns), index=len(df.columns) - 1)
+
+    # A model from the model store (written by this server) is used for batch scoring instead of the trained one
+    st.markdown('**1.3. Load a saved model**')
+    stored_artifacts = list_stored_artifacts()
+    loaded_artifact_name = st.selectbox('Saved model', stored_artifacts, index=None, placeholder='Use the model trained below')
+    loaded_artifact = None
+    if loaded_artifact_name is not None:
+        loaded_artifact = get_stored_artifact(loaded_artifact_name, os.path.getmtime(store_path(loaded_artifact_name)))
+    elif ALLOW_MODEL_UPLOAD:
+        # Uploaded models stay in this session; they are never added to the model store other sessions list
+        model_upload = st.file_uploader('Or upload an exported model', type=['joblib'])
+        if model_upload is not None:
+            uploaded_artifact = st.session_state.get('uploaded_artifact')
+            if uploaded_artifact is None or uploaded_artifact['file_id'] != model_upload.file_id:
+                try:
+                    st.session_state.uploaded_artifact = uploaded_artifact = {
+                        'file_id': model_upload.file_id,
+                        'name': 'upload-' + hashlib.sha256(model_upload.getvalue()).hexdigest()[:12],
+                        'artifact': read_uploaded_artifact(model_upload),
+                    }
+                except Exception as error:
+                    uploaded_artifact = None
+                    st.error(f'The model could not be loaded: {error}')
+            if uploaded_artifact is not None:
+                loaded_artifact_name, loaded_artifact = uploaded_artifact['name'], uploaded_artifact['artifact']
+        else:
+            st.session_state.pop('uploaded_artifact', None)
+    if loaded_artifact is not None:
+        st.caption(f"{type(loaded_artifact['model']).__name__}, {model_size(loaded_artifact['model'])} trees, {len(loaded_artifact['feature_dtypes'])} features, target *{loaded_artifact['target_name']}*")
+    profiler.stop()
 
     st.header('2. Set Parameters')
     parameter_split_size = st.slider('Data split ratio (% for Training Set)', 10, 90, 80, 5)
+    parameter_evaluation = st.radio('Evaluation', ['Holdout', 'K-fold cross-validation'], horizontal=True)
+    if parameter_evaluation == 'K-fold cross-validation':
+        parameter_n_folds = st.slider('Number of folds (k)', 3, 10, 5, 1)
+
+    # Histogram gradient boosting bins the features and scales to millions of rows; extra-trees skips the split search
+    parameter_estimator = st.selectbox('Estimator', list(ESTIMATORS), key='estimator')
+    boosting = parameter_estimator == 'Histogram gradient boosting'
 
     st.subheader('2.1. Learning Parameters')
     with st.expander('See parameters'):
-        parameter_n_estimators = st.slider('Number of estimators (n_estimators)', 0, 1000, 100, 100)
-        parameter_max_features = st.select_slider('Max features (max_features)', options=['all', 'sqrt', 'log2'])
-        parameter_min_samples_split = st.slider('Minimum number of samples required to split an internal node (min_samples_split)', 2, 10, 2, 1)
-        parameter_min_samples_leaf = st.slider('Minimum number of samples required to be at a leaf node (min_samples_leaf)', 1, 10, 2, 1)
+        if boosting:
+            parameter_max_iter = st.slider('Number of boosting iterations (max_iter)', 10, 1000, 100, 10, key='max_iter')
+            parameter_warm_start = st.toggle('Grow the previous model when only max_iter increases (warm_start)', value=True)
+            parameter_learning_rate = st.select_slider('Learning rate (learning_rate)', options=[0.01, 0.03, 0.05, 0.1, 0.2, 0.3, 0.5, 1.0], value=0.1, key='learning_rate')
+            parameter_max_leaf_nodes = st.slider('Maximum number of leaves per tree (max_leaf_nodes)', 2, 255, 31, 1, key='max_leaf_nodes')
+            parameter_hgb_min_samples_leaf = st.slider('Minimum number of samples required to be at a leaf node (min_samples_leaf)', 1, 200, 20, 1, key='hgb_min_samples_leaf')
+            parameter_l2_regularization = st.slider('L2 regularization of the leaf values (l2_regularization)', 0.0, 10.0, 0.0, 0.1, key='l2_regularization')
+            parameter_max_bins = st.slider('Number of histogram bins per feature (max_bins)', 2, 255, 255, 1, key='max_bins')
+            parameter_early_stopping = st.select_slider('Stop early on a validation split (early_stopping)', options=['auto', True, False], key='early_stopping')
+        else:
+            parameter_n_estimators = st.slider('Number of estimators (n_estimators)', 0, 1000, 100, 100, key='n_estimators')
+            parameter_warm_start = st.toggle('Grow or trim the previous forest when only n_estimators changes (warm_start)', value=True)
+            parameter_max_features = st.select_slider('Max features (max_features)', options=['all', 'sqrt', 'log2'], key='max_features')
+            parameter_min_samples_split = st.slider('Minimum number of samples required to split an internal node (min_samples_split)', 2, 10, 2, 1, key='min_samples_split')
+            parameter_min_samples_leaf = st.slider('Minimum number of samples required to be at a leaf node (min_samples_leaf)', 1, 10, 2, 1, key='min_samples_leaf')
 
     st.subheader('2.2. General Parameters')
     with st.expander('See parameters', expanded=False):
         parameter_random_state = st.slider('Seed number (random_state)', 0, 1000, 42, 1)
-        parameter_criterion = st.select_slider('Performance measure (criterion)', options=['squared_error', 'absolute_error', 'friedman_mse'])
-        parameter_bootstrap = st.select_slider('Bootstrap samples when building trees (bootstrap)', options=[True, False])
-        parameter_oob_score = st.select_slider('Whether to use out-of-bag samples to estimate the R^2 on unseen data (oob_score)', options=[False, True])
+        parameter_n_jobs = st.number_input('Number of CPU cores used for training (n_jobs)', 1, os.cpu_count() or 1, os.cpu_count() or 1, disabled=boosting,
+                                           help='Histogram gradient boosting always uses every core.')
+        if not boosting:
+            parameter_criterion = st.select_slider('Performance measure (criterion)', options=['squared_error', 'absolute_error', 'friedman_mse'], key='criterion')
+            parameter_bootstrap = st.select_slider('Bootstrap samples when building trees (bootstrap)', options=[True, False])
+            parameter_oob_score = st.select_slider('Whether to use out-of-bag samples to estimate the R^2 on unseen data (oob_score)', options=[False, True])
+
+    st.header('3. Hyperparameter sweep')
+    sweep_mode = st.toggle('Enable sweep mode', disabled=boosting, help='Sweeps cover the forest estimators.') and not boosting
+    if sweep_mode:
+        with st.expander('See sweep ranges', expanded=True):
+            sweep_n_estimators = st.slider('Number of estimators (n_estimators)', 100, 1000, (100, 300), 100, key='sweep_n_estimators')
+            sweep_max_features = st.multiselect('Max features (max_features)', ['all', 'sqrt', 'log2'], default=['all', 'sqrt'], key='sweep_max_features')
+            sweep_min_samples_split = st.slider('Minimum number of samples required to split an internal node (min_samples_split)', 2, 10, (2, 4), 1, key='sweep_min_samples_split')
+            sweep_min_samples_leaf = st.slider('Minimum number of samples required to be at a leaf node (min_samples_leaf)', 1, 10, (1, 3), 1, key='sweep_min_samples_leaf')
+            sweep_criterion = st.multiselect('Performance measure (criterion)', ['squared_error', 'absolute_error', 'friedman_mse'], default=['squared_error'], key='sweep_criterion')
+        sweep_grid = {
+            'n_estimators': list(range(sweep_n_estimators[0], sweep_n_estimators[1] + 1, 100)),
+            'max_features': [None if value == 'all' else value for value in sweep_max_features],
+            'min_samples_split': list(range(sweep_min_samples_split[0], sweep_min_samples_split[1] + 1)),
+            'min_samples_leaf': list(range(sweep_min_samples_leaf[0], sweep_min_samples_leaf[1] + 1)),
+            'criterion': sweep_criterion,
+        }
+        sweep_grid_size = int(np.prod([len(values) for values in sweep_grid.values()]))
+        sweep_search = st.radio('Search strategy', ['Grid', 'Random sample'], horizontal=True)
+        sweep_n_samples = None
+        if sweep_search == 'Random sample':
+            sweep_n_samples = st.number_input('Number of configurations to sample', 1, max(sweep_grid_size, 1), min(20, max(sweep_grid_size, 1)))
+        st.caption(f'{sweep_n_samples or sweep_grid_size} of {sweep_grid_size} configurations, fitted in parallel on {os.cpu_count()} cores.')
+        run_sweep_clicked = st.button('Run sweep', disabled=sweep_grid_size == 0)
+
+    st.header('4. Learning curve')
+    curve_mode = st.toggle('Enable learning curve', help='Fit the current model on growing subsamples of the training set to find where more rows stop paying off.')
+    if curve_mode:
+        curve_percentages = sorted(st.multiselect('Subsample sizes (% of the training set)', [1, 2, 5, 10, 25, 50, 75, 100], default=[1, 5, 10, 25, 100]))
+        # max_samples only exists for forests that bootstrap
+        curve_max_samples_available = not boosting and parameter_bootstrap
+        curve_sampling = st.radio('Subsample by', ['Rows', 'Bootstrap max_samples'], horizontal=True, disabled=not curve_max_samples_available,
+                                  help='Rows fits each model on a random subset of the training rows; max_samples lets every tree draw that share of all rows.')
+        curve_use_max_samples = curve_sampling == 'Bootstrap max_samples' and curve_max_samples_available
+        st.caption(f'{len(curve_percentages)} models, fitted in parallel on {os.cpu_count()} cores.')
+        run_curve_clicked = st.button('Run learning curve', disabled=not curve_percentages)
+
+    # Statistics of the cache shared by all sessions, as of the start of this run
+    with st.expander('Admin: shared cache'):
+        shared_cache_stats = get_shared_cache().stats()
+        shared_cache_lookups = shared_cache_stats['hits'] + shared_cache_stats['misses']
+        cache_col = st.columns(2)
+        cache_col[0].metric('Hit rate', f"{shared_cache_stats['hits'] / shared_cache_lookups:.0%}" if shared_cache_lookups else 'n/a')
+        cache_col[1].metric('Resident (MB)', f"{shared_cache_stats['resident_bytes'] / 2**20:,.1f} of {shared_cache_stats['max_bytes'] / 2**20:,.0f}")
+        st.caption(f"{shared_cache_stats['hits']:,} hits, {shared_cache_stats['misses']:,} misses, "
+                   f"{shared_cache_stats['evictions']:,} evictions, {shared_cache_stats['entries']} entries; "
+                   f"{shared_cache_stats['rejections']:,} values were too large for the budget and kept per session instead")
+        st.dataframe(get_shared_cache().to_frame().round(2), hide_index=True, use_container_width=True)
+        if ALLOW_CACHE_CLEAR:
+            st.button('Clear shared cache', on_click=get_shared_cache().clear)
+
 
-    sleep_time = st.slider('Sleep time', 0, 3, 0)
 
 # Initiate the model building process
 if uploaded_file or example_data: 
     with st.status("Running ...", expanded=True) as status:
     
         st.write("Loading data ...")
-        time.sleep(sleep_time)
 
         st.write("Preparing data ...")
-        time.sleep(sleep_time)
-        X = df.iloc[:,:-1]
-        y = df.iloc[:,-1]
+        profiler.start('prepare')
+        shared_cache = get_shared_cache()
+        session_cache = get_session_cache()
+        dataset_fingerprint = shared_cache.get_or_compute(make_key('fingerprint', dataset_source), lambda: dataframe_fingerprint(df), 'fingerprint')
+        try:
+            features, y = get_labelled_data(dataset_fingerprint, parameter_target, df)
+        except ValueError as error:
+            st.error(str(error))
+            st.stop()
             
         st.write("Splitting data ...")
-        time.sleep(sleep_time)
-        X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=(100-parameter_split_size)/100, random_state=parameter_random_state)
+        profiler.start('split')
+        split_key = make_key(dataset_fingerprint, parameter_target, parameter_split_size, parameter_random_state)
+        X_train, X_test, y_train, y_test, preprocessor = get_prepared_split(
+            split_key, features, y, (100-parameter_split_size)/100, parameter_random_state)
+        profiler.stop()
     
-        st.write("Model training ...")
-        time.sleep(sleep_time)
+        if boosting:
+            model_params = {
+                'max_iter': parameter_max_iter,
+                'learning_rate': parameter_learning_rate,
+                'max_leaf_nodes': parameter_max_leaf_nodes,
+                'min_samples_leaf': parameter_hgb_min_samples_leaf,
+                'l2_regularization': parameter_l2_regularization,
+                'max_bins': parameter_max_bins,
+                'early_stopping': parameter_early_stopping,
+                'random_state': parameter_random_state,
+            }
+        else:
+            if parameter_max_features == 'all':
+                parameter_max_features = None
+                parameter_max_features_metric = X_train.shape[1]
+            else:
+                parameter_max_features_metric = parameter_max_features
 
-        if parameter_max_features == 'all':
-            parameter_max_features = None
-            parameter_max_features_metric = X.shape[1]
-        
-        rf = RandomForestRegressor(
-                n_estimators=parameter_n_estimators,
-                max_features=parameter_max_features,
-                min_samples_split=parameter_min_samples_split,
-                min_samples_leaf=parameter_min_samples_leaf,
-                random_state=parameter_random_state,
-                criterion=parameter_criterion,
-                bootstrap=parameter_bootstrap,
-                oob_score=parameter_oob_score)
-        rf.fit(X_train, y_train)
-        
-        st.write("Applying model to make predictions ...")
-        time.sleep(sleep_time)
-        y_train_pred = rf.predict(X_train)
-        y_test_pred = rf.predict(X_test)
-            
-        st.write("Evaluating performance metrics ...")
-        time.sleep(sleep_time)
-        train_mse = mean_squared_error(y_train, y_train_pred)
-        train_r2 = r2_score(y_train, y_train_pred)
-        test_mse = mean_squared_error(y_test, y_test_pred)
-        test_r2 = r2_score(y_test, y_test_pred)
+            model_params = {
+                'n_estimators': parameter_n_estimators,
+                'max_features': parameter_max_features,
+                'min_samples_split': parameter_min_samples_split,
+                'min_samples_leaf': parameter_min_samples_leaf,
+                'random_state': parameter_random_state,
+                'criterion': parameter_criterion,
+                'bootstrap': parameter_bootstrap,
+                'oob_score': parameter_oob_score,
+            }
+        # Number of trees (forests) or boosting iterations to build
+        parameter_size = model_params[SIZE_PARAMETERS[parameter_estimator]]
+
+        # Reuse the fitted model when the data, split and hyperparameters are unchanged, whichever session trained it
+        if 'forest_index' not in st.session_state:
+            st.session_state.forest_index = LRUCache(MODEL_CACHE_SIZE)
+        forest_key, model_key = model_cache_keys(split_key, parameter_estimator, model_params)
+        # A parameter change while this session waits for training abandons the job of the old parameters,
+        # so dragging a slider through several values does not queue a fit for each of them; the job keeps
+        # running while other sessions wait for it
+        session_id = st.session_state.setdefault('session_id', uuid.uuid4().hex)
+        training_job_key = st.session_state.pop('training_job_key', None)
+        if training_job_key is not None and training_job_key != model_key:
+            get_job_manager().abandon(training_job_key, session_id)
+        model_entry = shared_cache.get(model_key)
+
+        if model_entry is None:
+            # Training runs as a background job keyed by model_key: reruns, and sessions reopened after a
+            # disconnect, attach to the running job instead of starting another one
+            job_manager = get_job_manager()
+            job = job_manager.get(model_key)
+            if job is None or job.status == 'failed':
+                partial_fit = st.session_state.get('partial_fit')
+                previous_key = st.session_state.forest_index.get(forest_key)
+                previous_entry = None if previous_key is None else shared_cache.get(previous_key)
+                # copy_model returns None for models that cannot be grown to parameter_size
+                forest = None
+                forest_params = {} if boosting else {'n_jobs': parameter_n_jobs, 'oob_score': parameter_oob_score}
+                if partial_fit is not None and partial_fit['forest_key'] == forest_key:
+                    forest = copy_model(partial_fit['forest'], parameter_size, **forest_params)
+                elif parameter_warm_start and previous_entry is not None:
+                    forest = copy_model(previous_entry['model'], parameter_size, **forest_params)
+                if forest is None:
+                    forest = make_estimator(parameter_estimator, model_params, n_jobs=parameter_n_jobs)
+                st.session_state.pop('partial_fit', None)
+                # Forest batches are a multiple of n_jobs so every core stays busy; about 20 progress updates per fit
+                batch_size = max(parameter_size // 20, 1)
+                if not boosting:
+                    batch_size = -(-batch_size // parameter_n_jobs) * parameter_n_jobs
+                job = job_manager.submit(model_key, forest, parameter_size, X_train, y_train, X_test, y_test, batch_size, session_id)
+
+            if job.status == 'failed':
+                st.error(f'Training failed: {job.error}')
+                job_manager.discard(model_key)
+                st.stop()
+            if not job.finished:
+                job_manager.watch(model_key, session_id)
+                st.session_state.training_job_key = model_key
+                st.write("Model training in the background ...")
+                show_job_progress(job)
+                st.button('Cancel training', on_click=cancel_training, args=(model_key,))
+                st.stop()
+
+            st.write("Collecting the trained model ...")
+            model_entry = job.result
+            # Once the shared cache holds the result the job is no longer needed; results above the budget stay with the job
+            if shared_cache.put(model_key, model_entry, 'model'):
+                job_manager.discard(model_key)
+            for timing in model_entry['timings']:
+                profiler.add(f"{timing['stage']} (background)", timing['wall_time_s'], timing['cpu_time_s'])
+        else:
+            st.write("Reusing cached model ...")
+        st.session_state.forest_index.put(forest_key, model_key)
+
+        model = model_entry['model']
+        y_train_pred = model_entry['y_train_pred']
+        y_test_pred = model_entry['y_test_pred']
+        train_mse = model_entry['train_mse']
+        train_r2 = model_entry['train_r2']
+        test_mse = model_entry['test_mse']
+        test_r2 = model_entry['test_r2']
+
+        # Cross-validation results are cached next to the holdout models, so switching modes never retrains
+        cv_entry = None
+        if parameter_evaluation == 'K-fold cross-validation':
+            cv_key = model_cache_keys(make_key(dataset_fingerprint, parameter_target, 'cv', parameter_n_folds), parameter_estimator, model_params)[1]
+            cv_entry = shared_cache.get(cv_key, session_cache.get(cv_key))
+            if cv_entry is None:
+                st.write(f"Cross-validating over {parameter_n_folds} folds ...")
+                profiler.start('cross-validation')
+                cv_entry = cross_validate_model(model_params, features, y, parameter_n_folds, parameter_random_state, estimator=parameter_estimator)
+                if not shared_cache.put(cv_key, cv_entry, 'cross-validation'):
+                    session_cache.put(cv_key, cv_entry)
+                profiler.stop()
+            else:
+                st.write("Reusing cached cross-validation results ...")
         
         st.write("Displaying performance metrics ...")
-        time.sleep(sleep_time)
-        parameter_criterion_string = ' '.join([x.capitalize() for x in parameter_criterion.split('_')])
+        profiler.start('render')
+        # Gradient boosting minimises the squared error
+        parameter_criterion_string = ' '.join([x.capitalize() for x in (parameter_criterion if not boosting else 'squared_error').split('_')])
         #if 'Mse' in parameter_criterion_string:
         #    parameter_criterion_string = parameter_criterion_string.replace('Mse', 'MSE')
-        rf_results = pd.DataFrame(['Random forest', train_mse, train_r2, test_mse, test_r2]).transpose()
+        rf_results = pd.DataFrame([parameter_estimator, train_mse, train_r2, test_mse, test_r2]).transpose()
         rf_results.columns = ['Method', f'Training {parameter_criterion_string}', 'Training R2', f'Test {parameter_criterion_string}', 'Test R2']
         # Convert objects to numerics
         for col in rf_results.columns:
             rf_results[col] = pd.to_numeric(rf_results[col], errors='ignore')
         # Round to 3 digits
         rf_results = rf_results.round(3)
+        if cv_entry is not None:
+            cv_results = cv_entry['fold_metrics'][['train_mse', 'train_r2', 'test_mse', 'test_r2']].agg(['mean', 'std']).T.round(3)
+            cv_results.index = rf_results.columns[1:]
         
     status.update(label="Status", state="complete", expanded=False)
 
+    if model_entry.get('cancelled'):
+        st.warning(f'Training was cancelled after {model_size(model)} of {parameter_size} trees. The results below use this partial model.')
+        st.button('Resume training', on_click=resume_training, args=(model_key, forest_key))
+
     # Display data info
     st.header('Input data', divider='rainbow')
     col = st.columns(4)
-    col[0].metric(label="No. of samples", value=X.shape[0], delta="")
-    col[1].metric(label="No. of X variables", value=X.shape[1], delta="")
+    col[0].metric(label="No. of samples", value=len(y), delta="")
+    col[1].metric(label="No. of X variables", value=X_train.shape[1], delta="")
     col[2].metric(label="No. of Training samples", value=X_train.shape[0], delta="")
     col[3].metric(label="No. of Test samples", value=X_test.shape[0], delta="")
     
+    # Only a page or a sample of each frame is sent to the browser
     with st.expander('Initial dataset', expanded=True):
-        st.dataframe(df, height=210, use_container_width=True)
+        rows = preview_rows(len(df), 'dataset')
+        st.dataframe(df.iloc[rows], height=210, use_container_width=True)
+    with st.expander('Preprocessing', expanded=False):
+        st.dataframe(preprocessor.summary(), hide_index=True, use_container_width=True)
+        st.caption('Medians and categories are learned from the training split only; cross-validation relearns them in each fold.')
+        if len(y) < len(df):
+            st.caption(f'{len(df) - len(y):,} rows without a value for {parameter_target} were dropped.')
     with st.expander('Train split', expanded=False):
+        rows = preview_rows(len(X_train), 'train')
         train_col = st.columns((3,1))
         with train_col[0]:
             st.markdown('**X**')
-            st.dataframe(X_train, height=210, hide_index=True, use_container_width=True)
+            st.dataframe(X_train.iloc[rows], height=210, hide_index=True, use_container_width=True)
         with train_col[1]:
             st.markdown('**y**')
-            st.dataframe(y_train, height=210, hide_index=True, use_container_width=True)
+            st.dataframe(y_train.iloc[rows], height=210, hide_index=True, use_container_width=True)
     with st.expander('Test split', expanded=False):
+        rows = preview_rows(len(X_test), 'test')
         test_col = st.columns((3,1))
         with test_col[0]:
             st.markdown('**X**')
-            st.dataframe(X_test, height=210, hide_index=True, use_container_width=True)
+            st.dataframe(X_test.iloc[rows], height=210, hide_index=True, use_container_width=True)
         with test_col[1]:
             st.markdown('**y**')
-            st.dataframe(y_test, height=210, hide_index=True, use_container_width=True)
-
-    # Zip dataset files
-    df.to_csv('dataset.csv', index=False)
-    X_train.to_csv('X_train.csv', index=False)
-    y_train.to_csv('y_train.csv', index=False)
-    X_test.to_csv('X_test.csv', index=False)
-    y_test.to_csv('y_test.csv', index=False)
-    
-    list_files = ['dataset.csv', 'X_train.csv', 'y_train.csv', 'X_test.csv', 'y_test.csv']
-    with zipfile.ZipFile('dataset.zip', 'w') as zipF:
-        for file in list_files:
-            zipF.write(file, compress_type=zipfile.ZIP_DEFLATED)
+            st.dataframe(y_test.iloc[rows], height=210, hide_index=True, use_container_width=True)
 
-    with open('dataset.zip', 'rb') as datazip:
+    # Zip dataset files in memory, only once the user asks for them, and keep the archive for this split
+    if st.session_state.get('dataset_zip_key') != split_key:
+        if st.button('Prepare ZIP'):
+            st.session_state.dataset_zip = build_dataset_zip({
+                'dataset.csv': df,
+                'X_train.csv': X_train,
+                'y_train.csv': y_train,
+                'X_test.csv': X_test,
+                'y_test.csv': y_test,
+            })
+            st.session_state.dataset_zip_key = split_key
+    if st.session_state.get('dataset_zip_key') == split_key:
         btn = st.download_button(
                 label='Download ZIP',
-                data=datazip,
+                data=st.session_state.dataset_zip,
                 file_name="dataset.zip",
                 mime="application/octet-stream"
                 )
@@ -192,27 +626,120 @@ if uploaded_file or example_data:
     st.header('Model parameters', divider='rainbow')
     parameters_col = st.columns(3)
     parameters_col[0].metric(label="Data split ratio (% for Training Set)", value=parameter_split_size, delta="")
-    parameters_col[1].metric(label="Number of estimators (n_estimators)", value=parameter_n_estimators, delta="")
-    parameters_col[2].metric(label="Max features (max_features)", value=parameter_max_features_metric, delta="")
-    
-    # Display feature importance plot
-    importances = rf.feature_importances_
-    feature_names = list(X.columns)
-    forest_importances = pd.Series(importances, index=feature_names)
-    df_importance = forest_importances.reset_index().rename(columns={'index': 'feature', 0: 'value'})
+    if boosting:
+        parameters_col[1].metric(label="Boosting iterations (n_iter_ of max_iter)", value=f'{model_size(model)} of {parameter_max_iter}', delta="")
+        parameters_col[2].metric(label="Learning rate (learning_rate)", value=parameter_learning_rate, delta="")
+    else:
+        parameters_col[1].metric(label="Number of estimators (n_estimators)", value=parameter_n_estimators, delta="")
+        parameters_col[2].metric(label="Max features (max_features)", value=parameter_max_features_metric, delta="")
     
-    bars = alt.Chart(df_importance).mark_bar(size=40).encode(
-             x='value:Q',
-             y=alt.Y('feature:N', sort='-x')
-           ).properties(height=250)
+    # Display feature importance plot (impurity-based importances only exist for forests)
+    if hasattr(model, 'feature_importances_'):
+        importances = model.feature_importances_
+        feature_names = list(X_train.columns)
+        forest_importances = pd.Series(importances, index=feature_names)
+        df_importance = forest_importances.reset_index().rename(columns={'index': 'feature', 0: 'value'})
+
+        bars = alt.Chart(df_importance).mark_bar(size=40).encode(
+                 x='value:Q',
+                 y=alt.Y('feature:N', sort='-x')
+               ).properties(height=250)
 
     performance_col = st.columns((2, 0.2, 3))
     with performance_col[0]:
         st.header('Model performance', divider='rainbow')
-        st.dataframe(rf_results.T.reset_index().rename(columns={'index': 'Parameter', 0: 'Value'}))
+        if cv_entry is None:
+            st.dataframe(rf_results.T.reset_index().rename(columns={'index': 'Parameter', 0: 'Value'}))
+        else:
+            st.dataframe(cv_results.reset_index().rename(columns={'index': 'Parameter', 'mean': 'Mean', 'std': 'Std'}), hide_index=True)
+            st.caption(f'Mean and standard deviation over {parameter_n_folds} cross-validation folds.')
     with performance_col[2]:
         st.header('Feature importance', divider='rainbow')
-        st.altair_chart(bars, theme='streamlit', use_container_width=True)
+        show_permutation = st.toggle('Add permutation importance on the test set', value=not hasattr(model, 'feature_importances_'),
+                                     help='Shuffles each feature n_repeats times and measures the drop in test R2; slower but unbiased.')
+        importance_col = st.columns(2 if show_permutation else 1)
+        permutation_importance = None
+        with importance_col[0]:
+            if hasattr(model, 'feature_importances_'):
+                st.markdown('**Impurity**')
+                st.altair_chart(bars, theme='streamlit', use_container_width=True)
+            else:
+                st.info(f'{parameter_estimator} has no impurity-based feature importances.')
+        if show_permutation:
+            with importance_col[-1]:
+                permutation_repeats = st.slider('Repeats per feature (n_repeats)', 1, 20, 5, key='permutation_repeats')
+                def compute_permutation_importance():
+                    profiler.start('permutation importance')
+                    with st.spinner('Permuting features ...'):
+                        importance = permutation_importances(model, X_test, y_test, permutation_repeats, parameter_random_state)
+                    profiler.start('render')
+                    return importance
+                # Cached under the model key, which is specific to the model and its test split
+                permutation_importance = shared_cache.get_or_compute(
+                    make_key(model_key, 'permutation importance', permutation_repeats), compute_permutation_importance,
+                    'permutation importance', session_cache)
+                st.markdown('**Permutation**')
+                st.altair_chart(permutation_importance_chart(permutation_importance), theme='streamlit', use_container_width=True)
+
+    # The latest holdout result of each estimator on this split, to weigh fit time against accuracy
+    estimator_comparison = st.session_state.setdefault('estimator_comparison', {})
+    if estimator_comparison.get('split_key') != split_key:
+        estimator_comparison.clear()
+        estimator_comparison['split_key'] = split_key
+        estimator_comparison['rows'] = {}
+    estimator_comparison['rows'][parameter_estimator] = {
+        'Estimator': parameter_estimator,
+        'Trees / iterations': model_size(model),
+        'Fit time (s)': model_entry['fit_time'],
+        'Training MSE': train_mse,
+        'Training R2': train_r2,
+        'Test MSE': test_mse,
+        'Test R2': test_r2,
+    }
+    st.header('Estimator comparison', divider='rainbow')
+    st.dataframe(pd.DataFrame(list(estimator_comparison['rows'].values())).round(3), hide_index=True, use_container_width=True)
+    st.caption('Holdout results of the last model of each estimator on this split. Pick another estimator in the sidebar to add it.')
+
+    # Record this run; the history keeps metrics and importances only, the models stay in the shared cache
+    run_history = st.session_state.setdefault('run_history', RunHistory(RUN_HISTORY_SIZE))
+    run_importances, run_importance_kind = None, None
+    if hasattr(model, 'feature_importances_'):
+        run_importances, run_importance_kind = pd.Series(model.feature_importances_, index=X_train.columns), 'impurity'
+    elif permutation_importance is not None:
+        run_importances, run_importance_kind = permutation_importance.set_index('feature')['importance'], 'permutation'
+    run_metrics = {
+        'train_mse': train_mse,
+        'train_r2': train_r2,
+        'test_mse': test_mse,
+        'test_r2': test_r2,
+        'fit_time': model_entry['fit_time'],
+        'predict_time': sum(timing['wall_time_s'] for timing in model_entry.get('timings', []) if timing['stage'] == 'predict') or None,
+    }
+    run_params = dict(model_params, evaluation='holdout')
+    if cv_entry is not None:
+        run_metrics['cv_test_mse'] = cv_entry['fold_metrics']['test_mse'].mean()
+        run_metrics['cv_test_r2'] = cv_entry['fold_metrics']['test_r2'].mean()
+        run_params['evaluation'] = f'{parameter_n_folds}-fold CV'
+    run_history.add(model_key if cv_entry is None else cv_key, parameter_estimator, run_params, run_metrics, run_importances, run_importance_kind)
+
+    st.header('Run history', divider='rainbow')
+    history_selection = st.dataframe(
+        run_history.to_frame().round(3),
+        key='run_history_table',
+        on_select='rerun',
+        selection_mode='multi-row',
+        hide_index=True,
+        use_container_width=True)
+    newest_runs = list(reversed(run_history.runs))
+    compared_runs = [newest_runs[row] for row in history_selection.selection.rows if row < len(newest_runs)] or newest_runs[:2]
+    history_col = st.columns((2, 3))
+    with history_col[0]:
+        st.dataframe(run_history.compare_metrics(compared_runs).round(3), use_container_width=True)
+    with history_col[1]:
+        compared_importances = run_history.compare_importances(compared_runs)
+        if len(compared_importances):
+            st.altair_chart(importance_comparison_chart(compared_importances), theme='streamlit')
+    st.caption('Select rows to compare those runs side by side (the two latest runs by default). Nothing is retrained.')
 
     # Prediction results
     st.header('Prediction results', divider='rainbow')
@@ -227,23 +754,159 @@ if uploaded_file or example_data:
     df_test['class'] = 'test'
     
     df_prediction = pd.concat([df_train, df_test], axis=0)
+    if cv_entry is not None:
+        # Every sample is predicted by the fold model that did not see it
+        df_prediction = pd.DataFrame({'actual': y.reset_index(drop=True), 'predicted': cv_entry['oof_pred']})
+        df_prediction['class'] = 'out-of-fold'
     
     prediction_col = st.columns((2, 0.2, 3))
     
     # Display dataframe
     with prediction_col[0]:
-        st.dataframe(df_prediction, height=320, use_container_width=True)
+        rows = preview_rows(len(df_prediction), 'prediction', in_zip=False)
+        st.dataframe(df_prediction.iloc[rows], height=320, use_container_width=True)
 
     # Display scatter plot of actual vs predicted values
     with prediction_col[2]:
-        scatter = alt.Chart(df_prediction).mark_circle(size=60).encode(
-                        x='actual',
-                        y='predicted',
-                        color='class'
-                  )
-        st.altair_chart(scatter, theme='streamlit', use_container_width=True)
+        if len(df_prediction) <= SCATTER_MAX_POINTS:
+            scatter = alt.Chart(df_prediction).mark_circle(size=60).encode(
+                            x='actual',
+                            y='predicted',
+                            color='class'
+                      )
+            st.altair_chart(scatter, theme='streamlit', use_container_width=True)
+        else:
+            # The binned view is computed once and cached under the key of the predictions it summarises
+            prediction_bins = shared_cache.get_or_compute(
+                make_key(model_key if cv_entry is None else cv_key, 'prediction bins'),
+                lambda: bin_predictions(
+                    df_prediction['actual'].to_numpy(),
+                    df_prediction['predicted'].to_numpy(),
+                    df_prediction['class'].to_numpy()),
+                'prediction bins', session_cache)
+            st.altair_chart(density_chart(prediction_bins), theme='streamlit')
+            st.caption(f'{len(df_prediction):,} predictions binned into a density view.')
+
+    # Export the holdout model with the metadata needed to score new data
+    st.header('Model artifact', divider='rainbow')
+    artifact_name = f"{parameter_estimator.lower().replace(' ', '-')}-{model_size(model)}-{model_key[:12]}"
+    artifact_col = st.columns(2)
+    with artifact_col[0]:
+        if st.session_state.get('model_export_key') != model_key:
+            if st.button('Prepare model download'):
+                st.session_state.model_export = export_artifact(make_artifact(model, preprocessor.input_dtypes_, y.name, model_params, preprocessor))
+                st.session_state.model_export_key = model_key
+        if st.session_state.get('model_export_key') == model_key:
+            st.download_button(
+                label=f"Download model ({len(st.session_state.model_export) / 2**20:,.1f} MB)",
+                data=st.session_state.model_export,
+                file_name=artifact_name + ARTIFACT_SUFFIX,
+                mime='application/octet-stream',
+            )
+    with artifact_col[1]:
+        if artifact_name in list_stored_artifacts():
+            st.caption(f'Saved in the model store as *{artifact_name}*.')
+        elif st.button('Save to model store'):
+            store_artifact(make_artifact(model, preprocessor.input_dtypes_, y.name, model_params, preprocessor), artifact_name)
+            st.caption(f'Saved in the model store as *{artifact_name}*.')
+
+    if loaded_artifact is None:
+        batch_scoring(make_artifact(model, preprocessor.input_dtypes_, y.name, model_params, preprocessor), model_key)
+    else:
+        batch_scoring(loaded_artifact, loaded_artifact_name)
+
+    # Hyperparameter sweep
+    if sweep_mode:
+        profiler.start('sweep')
+        st.header('Hyperparameter sweep', divider='rainbow')
+        leaderboard_placeholder = st.empty()
+        # The leaderboard is only valid for the split and sampling settings it was run on
+        sweep_key = make_key(split_key, parameter_estimator, parameter_bootstrap, parameter_oob_score)
+        if run_sweep_clicked:
+            configurations = [
+                dict(configuration, random_state=parameter_random_state, bootstrap=parameter_bootstrap, oob_score=parameter_oob_score)
+                for configuration in sweep_configurations(sweep_grid, sweep_n_samples, parameter_random_state)]
+            sweep_progress = st.progress(0.0, text='Running sweep ...')
+            sweep_rows = []
+            for params, entry in run_sweep(configurations, X_train, y_train, X_test, y_test, estimator=parameter_estimator):
+                # Every configuration goes into the shared cache, whose memory budget decides which ones stay
+                shared_cache.put(model_cache_keys(split_key, parameter_estimator, params)[1], entry, 'model')
+                sweep_rows.append({
+                    'n_estimators': params['n_estimators'],
+                    'max_features': 'all' if params['max_features'] is None else params['max_features'],
+                    'min_samples_split': params['min_samples_split'],
+                    'min_samples_leaf': params['min_samples_leaf'],
+                    'criterion': params['criterion'],
+                    'Training MSE': entry['train_mse'],
+                    'Training R2': entry['train_r2'],
+                    'Test MSE': entry['test_mse'],
+                    'Test R2': entry['test_r2'],
+                    'Fit time (s)': entry['fit_time'],
+                })
+                sweep_progress.progress(len(sweep_rows) / len(configurations), text=f'{len(sweep_rows)} of {len(configurations)} configurations fitted')
+                leaderboard_placeholder.dataframe(pd.DataFrame(sweep_rows).sort_values('Test MSE').round(3), hide_index=True, use_container_width=True)
+            sweep_progress.empty()
+            st.session_state.sweep_results = pd.DataFrame(sweep_rows).sort_values('Test MSE').round(3).reset_index(drop=True)
+            st.session_state.sweep_key = sweep_key
+
+        if st.session_state.get('sweep_key') == sweep_key:
+            leaderboard_placeholder.dataframe(
+                st.session_state.sweep_results,
+                key='sweep_leaderboard',
+                on_select=select_sweep_row,
+                selection_mode='single-row',
+                hide_index=True,
+                use_container_width=True)
+            st.caption('Sort by clicking a column header. Select a row to load its parameters into the sidebar.')
+        else:
+            st.info('👈 Set the sweep ranges and click *"Run sweep"* to fill the leaderboard.')
+
+    # Learning curve over training-set size
+    if curve_mode:
+        profiler.start('learning curve')
+        st.header('Learning curve', divider='rainbow')
+        curve_key = make_key(model_key, tuple(curve_percentages), curve_use_max_samples)
+        if run_curve_clicked:
+            curve_progress = st.progress(0.0, text='Fitting subsamples ...')
+            curve_rows = []
+            for row in run_learning_curve(model_params, [percentage / 100 for percentage in curve_percentages], X_train, y_train, X_test, y_test,
+                                          curve_use_max_samples, estimator=parameter_estimator, random_state=parameter_random_state):
+                curve_rows.append(row)
+                curve_progress.progress(len(curve_rows) / len(curve_percentages), text=f'{len(curve_rows)} of {len(curve_percentages)} subsamples fitted')
+            curve_progress.empty()
+            st.session_state.learning_curve = pd.DataFrame(curve_rows).sort_values('n_samples').reset_index(drop=True)
+            st.session_state.learning_curve_key = curve_key
+
+        if st.session_state.get('learning_curve_key') == curve_key:
+            curve = st.session_state.learning_curve
+            curve_col = st.columns((3, 2))
+            with curve_col[0]:
+                st.altair_chart(learning_curve_chart(curve), theme='streamlit', use_container_width=True)
+            with curve_col[1]:
+                st.dataframe(curve.round(3), hide_index=True, use_container_width=True)
+            st.caption('Test R2 (solid) and fit time (dashed) of the current parameters on each subsample, scored on the full test set.')
+        else:
+            st.info('👈 Pick the subsample sizes and click *"Run learning curve"*.')
 
+    # Show the stage profile of this run inside the status panel
+    profiler.stop()
+    profile = profiler.to_frame()
+    status.update(label=f"Status ({profile['wall_time_s'].sum():.2f} s)")
+    with status:
+        st.markdown('**Performance profile**')
+        st.dataframe(profile.round(3), hide_index=True, use_container_width=True)
+        if PROFILE_MEMORY:
+            st.caption('Peak memory is traced for the whole server process, including other sessions and background training.')
+        st.download_button(
+            label='Download profile (JSON)',
+            data=profiler.to_json(),
+            file_name='profile.json',
+            mime='application/json',
+        )
     
 # Ask for CSV upload if none is detected
 else:
     st.warning('👈 Upload a CSV file or click *"Load example data"* to get started!')
+    # A saved model can score new data without a training set
+    if loaded_artifact is not None:
+        batch_scoring(loaded_artifact, loaded_artifact_name)
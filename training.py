@@ -0,0 +1,305 @@
+"""
+Training
+Model fitting helpers used by the Streamlit app.
+"""
+
+import copy
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed, parallel_config
+from sklearn.ensemble import ExtraTreesRegressor, HistGradientBoostingRegressor, RandomForestRegressor
+from sklearn.inspection import permutation_importance
+from sklearn.metrics import mean_squared_error, r2_score
+from sklearn.model_selection import KFold, ParameterGrid, ParameterSampler, cross_validate
+from sklearn.pipeline import make_pipeline
+
+from preprocessing import TablePreprocessor
+
+# Regressors offered by the app, and the parameter setting their size (trees or boosting iterations)
+ESTIMATORS = {
+    'Random forest': RandomForestRegressor,
+    'Extra trees': ExtraTreesRegressor,
+    'Histogram gradient boosting': HistGradientBoostingRegressor,
+}
+SIZE_PARAMETERS = {
+    'Random forest': 'n_estimators',
+    'Extra trees': 'n_estimators',
+    'Histogram gradient boosting': 'max_iter',
+}
+
+
+def make_estimator(estimator, params, n_jobs=None):
+    """Return an unfitted ESTIMATORS[estimator](**params).
+
+    n_jobs is only passed to estimators that accept it; histogram gradient
+    boosting always uses all cores through OpenMP.
+    """
+    estimator_class = ESTIMATORS[estimator]
+    if n_jobs is not None and 'n_jobs' in estimator_class().get_params():
+        params = dict(params, n_jobs=n_jobs)
+    return estimator_class(**params)
+
+
+def is_forest(model):
+    return isinstance(model, (RandomForestRegressor, ExtraTreesRegressor))
+
+
+def model_size(model):
+    """Return the number of trees (forests) or boosting iterations fitted so far"""
+    if is_forest(model):
+        return len(getattr(model, 'estimators_', []))
+    return getattr(model, 'n_iter_', 0)
+
+
+def score_predictions(y_train, y_train_pred, y_test, y_test_pred):
+    """Return the train/test MSE and R2 of a set of predictions"""
+    return {
+        'train_mse': mean_squared_error(y_train, y_train_pred),
+        'train_r2': r2_score(y_train, y_train_pred),
+        'test_mse': mean_squared_error(y_test, y_test_pred),
+        'test_r2': r2_score(y_test, y_test_pred),
+    }
+
+
+def evaluate_model(model, X_train, y_train, X_test, y_test):
+    """Return a model cache entry: the fitted model, its train/test predictions and metrics"""
+    y_train_pred = model.predict(X_train)
+    y_test_pred = model.predict(X_test)
+    entry = {'model': model, 'y_train_pred': y_train_pred, 'y_test_pred': y_test_pred}
+    entry.update(score_predictions(y_train, y_train_pred, y_test, y_test_pred))
+    return entry
+
+
+def fit_and_evaluate(params, X_train, y_train, X_test, y_test, estimator='Random forest'):
+    """Fit an ESTIMATORS[estimator](**params) and return its cache entry, including the fit time in seconds"""
+    start = time.perf_counter()
+    model = make_estimator(estimator, params).fit(X_train, y_train)
+    fit_time = time.perf_counter() - start
+    entry = evaluate_model(model, X_train, y_train, X_test, y_test)
+    entry['fit_time'] = fit_time
+    return entry
+
+
+def permutation_importances(model, X, y, n_repeats=5, random_state=None, n_jobs=-1):
+    """Return the mean and standard deviation of the drop in R2 when each column of X is shuffled.
+
+    Features are permuted in parallel threads, each predicting with a
+    single-threaded copy of a forest, so the model is never pickled to worker
+    processes. Gradient boosting predicts on every core, one feature at a time.
+    """
+    if is_forest(model):
+        model = copy_forest(model, len(model.estimators_), n_jobs=1)
+    else:
+        n_jobs = 1
+    with parallel_config(backend='threading'):
+        result = permutation_importance(model, X, y, scoring='r2', n_repeats=n_repeats, random_state=random_state, n_jobs=n_jobs)
+    return pd.DataFrame({'feature': X.columns, 'importance': result.importances_mean, 'std': result.importances_std})
+
+def sweep_configurations(grid, n_samples=None, random_state=None):
+    """Expand a {parameter: [values]} grid into parameter dicts, or draw n_samples of them without replacement"""
+    configurations = list(ParameterGrid(grid))
+    if n_samples is not None and n_samples < len(configurations):
+        configurations = list(ParameterSampler(grid, n_iter=n_samples, random_state=random_state))
+    return configurations
+
+
+def _sweep_task(params, X_train, y_train, X_test, y_test, estimator):
+    return params, fit_and_evaluate(params, X_train, y_train, X_test, y_test, estimator)
+
+
+def run_sweep(configurations, X_train, y_train, X_test, y_test, n_jobs=-1, estimator='Random forest'):
+    """Fit every forest configuration in a pool of worker processes and yield (params, entry) pairs as they finish.
+
+    Each forest is single-threaded, so the pool spreads the sweep over all cores.
+    Large training arrays are memory-mapped into the workers by joblib instead of being copied per task.
+    """
+    return Parallel(n_jobs=n_jobs, return_as='generator_unordered')(
+        delayed(_sweep_task)(params, X_train, y_train, X_test, y_test, estimator)
+        for params in configurations)
+
+
+def _learning_curve_task(params, fraction, use_max_samples, X_train, y_train, X_test, y_test, estimator, random_state):
+    if use_max_samples:
+        # Every tree draws its bootstrap sample of this size from the full training set
+        n_samples = max(round(fraction * len(X_train)), 1)
+        entry = fit_and_evaluate(dict(params, max_samples=fraction if fraction < 1 else None), X_train, y_train, X_test, y_test, estimator)
+    else:
+        n_samples = max(round(fraction * len(X_train)), 2)
+        rows = np.sort(np.random.default_rng(random_state).choice(len(X_train), n_samples, replace=False))
+        entry = fit_and_evaluate(params, X_train.iloc[rows], y_train.iloc[rows], X_test, y_test, estimator)
+    return {
+        'fraction': fraction,
+        'n_samples': n_samples,
+        'fit_time': entry['fit_time'],
+        'train_r2': entry['train_r2'],
+        'test_mse': entry['test_mse'],
+        'test_r2': entry['test_r2'],
+    }
+
+
+def run_learning_curve(params, fractions, X_train, y_train, X_test, y_test, use_max_samples=False, n_jobs=-1, estimator='Random forest', random_state=None):
+    """Fit one model per training-set fraction in a pool of worker processes and yield its metrics as they finish.
+
+    Each model is fitted on a random subsample of the training rows, or with
+    use_max_samples (bootstrapped forests only) on all rows with every tree
+    drawing max_samples=fraction of them. All models are scored on the full
+    test set, so test R2 and fit time can be plotted against sample size.
+    """
+    return Parallel(n_jobs=n_jobs, return_as='generator_unordered')(
+        delayed(_learning_curve_task)(params, fraction, use_max_samples, X_train, y_train, X_test, y_test, estimator, random_state)
+        for fraction in fractions)
+
+
+def cross_validate_model(params, X, y, n_splits=5, random_state=None, n_jobs=-1, estimator='Random forest'):
+    """Fit one ESTIMATORS[estimator](**params) per K-fold split of the raw features X in parallel.
+
+    Each fold fits its own TablePreprocessor on its training rows, so no fold is
+    scored on rows that shaped its encoding or imputation. Returns the per-fold
+    metrics (DataFrame) and the out-of-fold predictions for every row of X,
+    computed from the fold models without refitting.
+    """
+    results = cross_validate(
+        make_pipeline(TablePreprocessor(), make_estimator(estimator, params)), X, y,
+        cv=KFold(n_splits=n_splits, shuffle=True, random_state=random_state),
+        scoring={'mse': 'neg_mean_squared_error', 'r2': 'r2'},
+        return_train_score=True,
+        return_estimator=True,
+        return_indices=True,
+        n_jobs=n_jobs)
+    oof_pred = np.empty(len(y))
+    for estimator, test_index in zip(results['estimator'], results['indices']['test']):
+        oof_pred[test_index] = estimator.predict(X.iloc[test_index])
+    fold_metrics = pd.DataFrame({
+        'train_mse': -results['train_mse'],
+        'train_r2': results['train_r2'],
+        'test_mse': -results['test_mse'],
+        'test_r2': results['test_r2'],
+        'fit_time': results['fit_time'],
+    })
+    return {'fold_metrics': fold_metrics, 'oof_pred': oof_pred}
+
+
+def finish_forest(forest, X_train, y_train, oob_score):
+    """Switch warm_start off and, if oob_score is requested, compute the out-of-bag estimate of forest's current trees"""
+    for attribute in ('oob_score_', 'oob_prediction_'):
+        if hasattr(forest, attribute):
+            delattr(forest, attribute)
+    forest.set_params(n_estimators=len(forest.estimators_), oob_score=oob_score)
+    if oob_score:
+        # With warm_start and no extra trees, fit() only computes the missing out-of-bag estimate
+        forest.set_params(warm_start=True)
+        with warnings.catch_warnings():
+            warnings.filterwarnings('ignore', message='Warm-start fitting without increasing n_estimators')
+            forest.fit(X_train, y_train)
+    forest.set_params(warm_start=False)
+    return forest
+
+
+def grow_forest(forest, n_estimators, X_train, y_train, batch_size=None, on_batch=None):
+    """Grow forest (fitted or not) in place to n_estimators trees, batch_size trees at a time.
+
+    Trees are added through warm_start and each batch is built with the forest's
+    n_jobs; on_batch(forest) is called after every batch. Every tree draws its
+    seed from the same random_state sequence, so the result matches a single fit.
+    The out-of-bag estimate, if requested, is computed once at the end.
+    """
+    oob_score = forest.oob_score
+    forest.set_params(warm_start=True, oob_score=False)
+    n_trees = len(getattr(forest, 'estimators_', []))
+    if batch_size is None:
+        batch_size = max(n_estimators - n_trees, 1)
+    while n_trees < n_estimators:
+        n_trees = min(n_trees + batch_size, n_estimators)
+        forest.set_params(n_estimators=n_trees)
+        forest.fit(X_train, y_train)
+        if on_batch is not None:
+            on_batch(forest)
+    return finish_forest(forest, X_train, y_train, oob_score)
+
+
+def copy_forest(forest, n_estimators, **params):
+    """Return a copy of a fitted forest holding at most its first n_estimators trees, with params (e.g. n_jobs) set.
+
+    The source forest is left untouched (trees are shared, not copied).
+    Growing the copy with grow_forest continues the source's seed sequence.
+    """
+    copied = copy.copy(forest)
+    copied.estimators_ = list(forest.estimators_[:n_estimators])
+    copied.set_params(**params)
+    return copied
+
+
+def resize_forest(forest, n_estimators, X_train, y_train, batch_size=None, on_batch=None, **params):
+    """Return a copy of a fitted forest grown or truncated to n_estimators trees.
+
+    Growing fits only the missing trees (see grow_forest); truncating keeps the
+    first n_estimators trees, which matches a forest trained from scratch with
+    the same seed.
+    """
+    resized = copy_forest(forest, n_estimators, **params)
+    return grow_forest(resized, n_estimators, X_train, y_train, batch_size, on_batch)
+
+
+def early_stopped(model):
+    """Whether a fitted gradient boosting model meets its early stopping criterion.
+
+    A batch that ends exactly where a single fit would have stopped reports a
+    full batch, so the n_iter_no_change / tol window is checked here the same
+    way scikit-learn does after each iteration.
+    """
+    if not getattr(model, 'do_early_stopping_', False):
+        return False
+    scores = model.validation_score_ if len(model.validation_score_) else model.train_score_
+    reference_position = model.n_iter_no_change + 1
+    if len(scores) < reference_position:
+        return False
+    return not np.any(np.asarray(scores[-reference_position + 1:]) > scores[-reference_position] + model.tol)
+
+
+def grow_boosting(model, max_iter, X_train, y_train, batch_size=None, on_batch=None):
+    """Grow a gradient boosting model (fitted or not) in place to max_iter iterations, batch_size at a time.
+
+    Iterations are added through warm_start and on_batch(model) is called after
+    every batch. Growth ends as soon as the early stopping criterion is met
+    (see early_stopped), so the result matches a single fit with max_iter.
+    """
+    model.set_params(warm_start=True)
+    n_iter = model_size(model)
+    if batch_size is None:
+        batch_size = max(max_iter - n_iter, 1)
+    while n_iter < max_iter and not (n_iter and early_stopped(model)):
+        target = min(n_iter + batch_size, max_iter)
+        model.set_params(max_iter=target)
+        model.fit(X_train, y_train)
+        n_iter = model.n_iter_
+        if on_batch is not None:
+            on_batch(model)
+    model.set_params(warm_start=False)
+    return model
+
+
+def grow_model(model, size, X_train, y_train, batch_size=None, on_batch=None):
+    """Grow a forest (see grow_forest) or gradient boosting model (see grow_boosting) to size trees or iterations"""
+    if is_forest(model):
+        return grow_forest(model, size, X_train, y_train, batch_size, on_batch)
+    return grow_boosting(model, size, X_train, y_train, batch_size, on_batch)
+
+
+def copy_model(model, size, **params):
+    """Return a copy of a fitted model to continue growing to size, with params set, or None if it cannot be reused.
+
+    Forests are copied (and truncated) with copy_forest. Gradient boosting
+    models cannot drop iterations, so one with more than size iterations is not
+    reused; one that stopped early is, since grow_boosting stops it at the same
+    iteration a fresh fit would.
+    """
+    if is_forest(model):
+        return copy_forest(model, size, **params)
+    if model.n_iter_ > size:
+        return None
+    copied = copy.deepcopy(model)
+    copied.set_params(**params)
+    return copied